@@ -1,5 +1,6 @@
 
 from .loader import NetboxLoader
+from .multi import NetboxMultiLoader
 
 __title__ = 'prophetess-netbox'
 __version__ = '0.3.6'
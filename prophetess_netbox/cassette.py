@@ -0,0 +1,148 @@
+"""Record Netbox traffic to a file and replay it offline."""
+
+import gzip
+import json
+import logging
+import collections
+import collections.abc
+
+from urllib.parse import urlparse
+
+from prophetess_netbox.transport import Transport
+from prophetess_netbox.exceptions import CassetteMiss
+
+log = logging.getLogger('prophetess.plugins.netbox.cassette')
+
+# Never written to a cassette: secret keys, decrypted secrets, user token keys and passwords. Request headers
+# (Authorization, X-Session-Key) are not recorded at all
+redacted = ('private_key', 'session_key', 'plaintext', 'key', 'password')
+
+
+def redact(data, keys=redacted):
+    if isinstance(data, collections.abc.Mapping):
+        return {k: '<redacted>' if k in keys else redact(v, keys) for k, v in data.items()}
+
+    if isinstance(data, list):
+        return [redact(v, keys) for v in data]
+
+    return data
+
+
+def request_key(method, url, params=None, data=None):
+    """ Identify a request by its method, path, query and JSON body, independent of the host """
+    if isinstance(data, (str, bytes)):
+        try:
+            data = json.dumps(json.loads(data), sort_keys=True)
+        except ValueError:
+            data = None
+    elif data is not None:
+        # Form data is only used to fetch a session key
+        data = None
+
+    query = sorted((str(k), str(v)) for k, v in (params or {}).items())
+    return json.dumps([method.upper(), urlparse(url).path, query, data])
+
+
+class RecordedResponse:
+    """ The parts of an ``aiohttp.ClientResponse`` aionetbox and the client use """
+
+    request_info = None
+
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+    @property
+    def ok(self):
+        return self.status < 400
+
+    async def read(self):
+        return self.body.encode()
+
+    async def text(self):
+        return self.body
+
+    async def json(self):
+        return json.loads(self.body)
+
+    def release(self):
+        pass
+
+
+class RecordingTransport(Transport):
+    """ Transport which also writes every request and response to a gzipped JSONL cassette
+
+    The first line holds the OpenAPI spec so the cassette can be replayed without contacting Netbox. Request headers
+    are never written, and ``redacted`` values as well as any of the ``redact`` keys are removed from bodies.
+    """
+
+    def __init__(self, path, *, redact=(), **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.redacted = redacted + tuple(redact)
+        self.spec = None
+        self.file = None
+
+    def write(self, entry):
+        if self.file is None:
+            self.file = gzip.open(self.path, 'wt')
+            self.file.write(json.dumps({'spec': self.spec}) + '\n')
+
+        if entry is not None:
+            self.file.write(json.dumps(entry) + '\n')
+
+    async def request(self, **kwargs):
+        resp = await super().request(**kwargs)
+        body = await resp.text()
+
+        try:
+            body = json.dumps(redact(json.loads(body), self.redacted))
+        except ValueError:
+            pass
+
+        self.write({
+            'key': request_key(kwargs['method'], kwargs['url'], kwargs.get('params'), kwargs.get('data')),
+            'status': resp.status,
+            'body': body,
+        })
+
+        return resp
+
+    async def close(self):
+        self.write(None)
+        self.file.close()
+        await super().close()
+
+
+class ReplayTransport(Transport):
+    """ Transport serving responses from a cassette, without any network access
+
+    Requests are matched on method, path, query and body. A request made more often than it was recorded gets the
+    last recorded response again; one that was never recorded raises ``CassetteMiss``.
+    """
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.responses = collections.defaultdict(collections.deque)
+
+        with gzip.open(path, 'rt') as f:
+            self.spec = json.loads(f.readline())['spec']
+            for line in f:
+                entry = json.loads(line)
+                self.responses[entry['key']].append(RecordedResponse(entry['status'], entry['body']))
+
+        log.debug('Loaded {} recorded requests from {}'.format(len(self.responses), path))
+
+    async def request(self, **kwargs):
+        key = request_key(kwargs['method'], kwargs['url'], kwargs.get('params'), kwargs.get('data'))
+        self.requests[kwargs.get('method')] += 1
+
+        recorded = self.responses.get(key)
+        if not recorded:
+            raise CassetteMiss('No recorded response for {} {}'.format(kwargs['method'], kwargs['url']))
+
+        return recorded.popleft() if len(recorded) > 1 else recorded[0]
+
+    async def close(self):
+        pass
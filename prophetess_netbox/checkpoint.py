@@ -0,0 +1,108 @@
+"""Journal of completed records so interrupted runs can resume."""
+
+import os
+import json
+import time
+import logging
+import collections
+
+from prophetess_netbox.index import index_key
+
+log = logging.getLogger('prophetess.plugins.netbox.checkpoint')
+
+
+class Checkpoint:
+    """ Append-only JSONL journal of the pk params and outcome of every completed record
+
+    The journal lives at ``<path>/<run_id>.jsonl``. Starting with the same ``run_id`` loads it, and each entry in it
+    skips one record, so a pk journaled twice is skipped twice; records completed during this process are never
+    skipped. A pass over the records ends once none has completed for ``idle`` seconds, the next pass truncates the
+    journal and drops anything left to resume. A journal last written more than ``idle`` seconds before starting holds
+    a finished pass and is not resumed. Writes are fsync'd every ``fsync_every`` records and on close, so a crash
+    loses at most that many entries, which are then simply loaded again.
+    """
+
+    def __init__(self, *, path, run_id, fsync_every=100, idle=60):
+        self.file = os.path.join(path, '{}.jsonl'.format(run_id))
+        self.fsync_every = fsync_every
+        self.idle = idle
+        self.done = collections.Counter()
+        self.last = None
+        self.unsynced = 0
+        self._fh = None
+        self._mode = 'a'
+
+        if os.path.exists(self.file):
+            self.load()
+
+    @staticmethod
+    def key(params):
+        return index_key(tuple(sorted(params)), params)
+
+    def load(self):
+        if self.idle is not None and time.time() - os.path.getmtime(self.file) > self.idle:
+            log.debug('{} holds a finished pass, starting over'.format(self.file))
+            self._mode = 'w'
+            return
+
+        with open(self.file) as f:
+            for line in f:
+                try:
+                    self.done[self.key(json.loads(line)['pk'])] += 1
+                except (ValueError, KeyError):
+                    # A partially written last line from a crash
+                    continue
+
+        log.debug('Resuming with {} completed records from {}'.format(sum(self.done.values()), self.file))
+
+    def resume(self, params):
+        """ Whether the record was completed before an interruption, True once per journal entry """
+        key = self.key(params)
+        if not self.done[key]:
+            return False
+
+        self.done[key] -= 1
+        return True
+
+    def mark(self, params, result, obj_id=None):
+        now = time.monotonic()
+        if self.last is not None and self.idle is not None and now - self.last > self.idle:
+            self.rotate()
+        self.last = now
+
+        if self._fh is None:
+            os.makedirs(os.path.dirname(self.file) or '.', exist_ok=True)
+            self._fh = open(self.file, self._mode)
+            self._mode = 'a'
+
+        self._fh.write(json.dumps({'pk': params, 'result': result, 'id': obj_id}, default=str) + '\n')
+
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every:
+            self.sync()
+
+    def rotate(self):
+        """ Start the journal of a new pass """
+        log.debug('Starting a new pass, truncating {}'.format(self.file))
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+        self._mode = 'w'
+        self.done = collections.Counter()
+        self.unsynced = 0
+
+    def sync(self):
+        if self._fh is None:
+            return
+
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self.unsynced = 0
+
+    def close(self):
+        self.sync()
+
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
@@ -1,11 +1,22 @@
 """Client for Netbox API transactions."""
 
+import time
 import asyncio
 import logging
+import collections
+
+from urllib.parse import urlparse, parse_qsl
 
 from aionetbox import AIONetbox
+from aionetbox.api import NetboxResponseObject
 
+from prophetess_netbox.hedge import HedgePolicy
+from prophetess_netbox.index import ambiguous
+from prophetess_netbox.cassette import RecordingTransport, ReplayTransport
+from prophetess_netbox.lookup import LookupPlanner
+from prophetess_netbox.transport import Transport
 from prophetess_netbox.exceptions import (
+    GraphQLQueryFailed,
     InvalidPKConfig,
     InvalidNetboxEndpoint,
     InvalidNetboxOperation,
@@ -17,18 +28,42 @@ log = logging.getLogger('prophetess.plugins.netbox.client')
 class NetboxClient:
     """Re-usable abstraction to aionetbox"""
 
-    def __init__(self, *, host, api_key, loop=None):
+    def __init__(self, *, host, api_key, hedge=None, transport=None, lookup=None, loop=None):
         """Initialize a single instance with no authentication."""
         self.loop = loop or asyncio.get_event_loop()
-        self.__cache = {}  # TODO: make a decorator that caches api classes?
-
-        self.client = AIONetbox.from_openapi(url=host, api_key=api_key)
+        self.__cache = {}
+        self.host = host
+        self.hedge = HedgePolicy(**hedge) if hedge else None
+        self.stats = collections.defaultdict(collections.Counter)
+
+        transport = dict(transport or {})
+        redact = transport.pop('redact', ())
+        if 'replay' in transport:
+            self.transport = ReplayTransport(transport.pop('replay'), **transport)
+            self.client = AIONetbox(host, api_key, spec=self.transport.spec, session=self.transport)
+        elif 'record' in transport:
+            self.transport = RecordingTransport(transport.pop('record'), redact=redact, **transport)
+            self.client = AIONetbox.from_openapi(url=host, api_key=api_key, session=self.transport)
+            self.transport.spec = self.client.config.get('_orig')
+        else:
+            self.transport = Transport(**transport)
+            self.client = AIONetbox.from_openapi(url=host, api_key=api_key, session=self.transport)
+
+        self.lookup = LookupPlanner(self, **(lookup or {}))
 
     async def close(self):
+        self.lookup.close()
         await self.client.close()
 
     def build_model(self, endpoint, method, action):
-        """ Return the aionetbox Api method from an endpoint class """
+        """ Return the aionetbox Api method from an endpoint class, memoized per operation """
+        key = (endpoint, method, action)
+        if key not in self.__cache:
+            self.__cache[key] = self._resolve(endpoint, method, action)
+
+        return self.__cache[key]
+
+    def _resolve(self, endpoint, method, action):
         name = '{}_{}_{}'.format(endpoint, method.replace('-', '_'), action)
 
         try:
@@ -41,9 +76,21 @@ class NetboxClient:
         except AttributeError:
             raise InvalidNetboxOperation('{} not a valid operation'.format(name))
 
+    def spec(self, endpoint, model, action):
+        """ OpenAPI spec of an operation """
+        return self.build_model(endpoint, model, action).config
+
+    def url(self, endpoint, model):
+        """ Full URL of a model's list endpoint """
+        base = self.client.config.get('_orig', {}).get('basePath', '/api')
+        return '{}{}/{}/{}/'.format(self.client.host, base, endpoint, model)
+
     async def fetch(self, *, endpoint, model, params):
         func = self.build_model(endpoint, model, 'list')
         try:
+            if self.hedge:
+                return await self.hedge.run(func, **params)
+
             return await func(**params)
         except ValueError:
             # Bad Response
@@ -52,8 +99,36 @@ class NetboxClient:
             # Bad params
             raise
 
-    async def entity(self, *, endpoint, model, params):
-        """ Fetch a single record from netbox using one or more look up params """
+    async def entity(self, *, endpoint, model, params, full=False):
+        """ Fetch a single record from netbox using one or more look up params
+
+        Records answered from a local index only carry their ``id`` unless ``full`` is requested. Lookups, index hits
+        and time spent are counted per model in ``stats``.
+        """
+        start = time.monotonic()
+        try:
+            return await self._entity(endpoint=endpoint, model=model, params=params, full=full)
+        finally:
+            self.stats[(endpoint, model)]['lookups'] += 1
+            self.stats[(endpoint, model)]['time'] += time.monotonic() - start
+
+    async def _entity(self, *, endpoint, model, params, full):
+        index = await self.lookup.index(endpoint=endpoint, model=model, params=params)
+        obj_id = index.get(params) if index is not None else None
+
+        if obj_id == ambiguous:
+            # Several objects share the key, Netbox rejects the lookup like any other ambiguous pk
+            index, obj_id = None, None
+
+        if index is not None and (obj_id is not None or index.complete):
+            self.stats[(endpoint, model)]['hits'] += 1
+            if obj_id is None:
+                return None
+
+            if full:
+                return await self.read(endpoint=endpoint, model=model, id=obj_id)
+
+            return NetboxResponseObject.from_response(data={'id': obj_id}, type='object')
 
         data = await self.fetch(endpoint=endpoint, model=model, params=params)
 
@@ -64,7 +139,10 @@ class NetboxClient:
             kwargs = ', '.join('='.join(i) for i in params.items())
             raise InvalidPKConfig('Not enough criteria for <{}({})>'.format(endpoint, kwargs))
 
-        return data.results.pop(-1)
+        result = data.results.pop(-1)
+        self.lookup.resolved(endpoint, model, params, result)
+
+        return result
 
     async def entities(self, *, endpoint, model, params):
         """ Fetch all matching records from netbox using one or more look up params """
@@ -75,3 +153,102 @@ class NetboxClient:
             return None
 
         return data.results
+
+    async def read(self, *, endpoint, model, id):
+        """ Fetch a single record by id """
+        func = self.build_model(endpoint, model, 'read')
+        return await func(id=id)
+
+    async def page(self, *, endpoint, model, params=None):
+        """ Fetch a single page of a list, aionetbox would follow every page """
+        resp = await self.client.request(method='get', url=self.url(endpoint, model), query_params=params or {})
+
+        if not resp.ok:
+            raise InvalidNetboxOperation('Unable to list {}.{} ({})'.format(endpoint, model, resp.status))
+
+        return await resp.json()
+
+    async def pages(self, *, endpoint, model, params=None):
+        """ Yield every page of a list as plain dicts, without holding more than one page at a time """
+
+        query = dict(params or {})
+        while True:
+            data = await self.page(endpoint=endpoint, model=model, params=query)
+            yield data.get('results', [])
+
+            if not data.get('next'):
+                break
+
+            query = {**query, **dict(parse_qsl(urlparse(data['next']).query))}
+
+    async def objects(self, *, endpoint, model, ids):
+        """ Fetch objects by id as plain dicts, as few pages as possible """
+        objects = {}
+        params = {'id__in': ','.join(str(i) for i in ids), 'limit': len(ids)}
+        async for page in self.pages(endpoint=endpoint, model=model, params=params):
+            objects.update((obj['id'], obj) for obj in page)
+
+        return objects
+
+    async def count(self, *, endpoint, model, params=None):
+        """ Number of objects matching params, fetched with a single request """
+        data = await self.page(endpoint=endpoint, model=model, params={**(params or {}), 'limit': 1, 'brief': 1})
+        return data.get('count', 0)
+
+    async def marker(self, *, endpoint, model):
+        """ Cheap version marker of a model: its count, highest id and latest change """
+        latest, highest = await asyncio.gather(
+            self.page(endpoint=endpoint, model=model, params={'ordering': '-last_updated', 'limit': 1}),
+            self.page(endpoint=endpoint, model=model, params={'ordering': '-id', 'limit': 1, 'brief': 1}),
+        )
+
+        return {
+            'count': latest.get('count', 0),
+            'max_id': highest['results'][0]['id'] if highest.get('results') else 0,
+            'last_updated': latest['results'][0].get('last_updated') if latest.get('results') else None,
+        }
+
+    async def prepare(self, models, *, prefetch=None):
+        """ Resolve operations and warm connections for every model before the first record
+
+        ``models`` is a list of ``(endpoint, model, actions, names)``. Every operation is resolved up front, so a bad
+        endpoint or model raises here. Each model is then counted concurrently, which opens connections and checks
+        Netbox can list it, and models with ``names`` and no more than ``prefetch`` objects are prefetched.
+        """
+        for endpoint, model, actions, names in models:
+            for action in actions:
+                self.build_model(endpoint, model, action)
+
+        async def warm(endpoint, model, names):
+            if prefetch is not None and names:
+                await self.lookup.preload(endpoint, model, names, max_count=prefetch)
+            else:
+                await self.count(endpoint=endpoint, model=model)
+
+        await asyncio.gather(*(warm(endpoint, model, names) for endpoint, model, _, names in models))
+
+    def remember(self, endpoint, model, obj, created=False):
+        """ Record a newly written object in any local lookup index """
+        self.lookup.remember(endpoint, model, obj, created=created)
+
+    async def graphql(self, query):
+        """ Execute a query against the Netbox GraphQL API """
+
+        start = time.monotonic()
+        resp = await self.client.request(
+            method='post',
+            url='{}/graphql/'.format(self.client.host),
+            body={'query': query},
+        )
+        self.stats[('graphql', 'query')]['lookups'] += 1
+        self.stats[('graphql', 'query')]['time'] += time.monotonic() - start
+
+        try:
+            data = await resp.json()
+        except Exception:
+            data = {}
+
+        if not resp.ok or data.get('errors'):
+            raise GraphQLQueryFailed('GraphQL query failed ({}): {}'.format(resp.status, data.get('errors')))
+
+        return data.get('data', {})
@@ -0,0 +1,119 @@
+"""Merge repeated records for the same Netbox object."""
+
+import time
+import asyncio
+import logging
+import collections
+
+from prophetess.exceptions import ProphetessException
+
+log = logging.getLogger('prophetess.plugins.netbox.coalesce')
+
+
+class Periodic:
+    """ Call ``flush`` every ``interval`` seconds once started, and serialize it with any other ``run``
+
+    Errors of a periodic flush are logged the way the Prophetess pipeline logs loader errors, since no caller is
+    waiting on it.
+    """
+
+    def __init__(self, flush, interval):
+        self.flush = flush
+        self.interval = interval
+        self.task = None
+        self.lock = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # Cancelling on stop must not abandon a write in flight, a later run waits on the lock instead
+                await asyncio.shield(self.run())
+            except ProphetessException as e:
+                log.warning('Periodic flush failed: {}'.format(e))
+            except Exception as e:
+                log.error('Periodic flush raised unexpected exception: {}'.format(e))
+
+    async def run(self, *args, **kwargs):
+        """ Flush now, once any flush in flight has finished """
+        self.lock = self.lock or asyncio.Lock()
+        async with self.lock:
+            await self.flush(*args, **kwargs)
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+class Coalescer:
+    """ Hold records for ``window`` seconds, merging any that share a pk, last write wins
+
+    Held records are passed to ``flush(record, params)`` once their window has passed, when more than
+    ``max_pending`` are held, or on ``close``. Errors are logged the way the Prophetess pipeline logs loader errors,
+    since the record that caused them has long been returned from ``run``.
+    """
+
+    def __init__(self, flush, *, window=1.0, max_pending=1000):
+        self.flush_record = flush
+        self.window = window
+        self.max_pending = max_pending
+
+        self.pending = collections.OrderedDict()
+        self.merged = 0
+        self.timer = Periodic(self._flush, window / 2)
+
+    @staticmethod
+    def key(params):
+        return tuple((k, str(v)) for k, v in sorted(params.items()))
+
+    async def add(self, record, params):
+        key = self.key(params)
+
+        if key in self.pending:
+            self.pending[key][2].update(record)
+            self.merged += 1
+        else:
+            self.pending[key] = [time.monotonic(), params, dict(record)]
+
+        self.timer.start()
+
+        if len(self.pending) > self.max_pending:
+            await self.flush(count=len(self.pending) - self.max_pending)
+
+    async def flush(self, count=None):
+        """ Write records whose window has passed, or the ``count`` oldest records """
+        if not self.pending:
+            return
+
+        # Flushes are serialized so a record is never written while an earlier one for the same object is in flight
+        await self.timer.run(count)
+
+    async def _flush(self, count=None):
+        deadline = time.monotonic() - self.window
+
+        while self.pending:
+            key, (seen, params, record) = next(iter(self.pending.items()))
+            if count is None and seen > deadline:
+                break
+
+            del self.pending[key]
+            try:
+                await self.flush_record(record, params)
+            except ProphetessException as e:
+                log.warning('Coalesced record {} failed: {}'.format(params, e))
+            except Exception as e:
+                log.error('Coalesced record {} raised unexpected exception: {}'.format(params, e))
+
+            if count is not None:
+                count -= 1
+                if count <= 0:
+                    break
+
+    async def close(self):
+        self.timer.stop()
+        await self.flush(count=len(self.pending))
@@ -0,0 +1,62 @@
+"""Diff batches of records against existing Netbox objects."""
+
+import logging
+import collections
+import collections.abc
+
+log = logging.getLogger('prophetess.plugins.netbox.diff')
+
+
+class BatchDiff:
+    """ Compute the changes of a batch of records against the existing objects in one pass per field
+
+    Existing objects are the plain dicts of a list response, so nothing is converted to ``NetboxResponseObject`` first.
+    Each field is normalized once for the whole batch: with a ``plan`` nested values are reduced to what the spec says
+    is written for them, otherwise the first nested value of the column decides whether its ``id`` or ``value`` is
+    compared. ``casts`` (field to callable) are applied to existing values, as records are already sanitized.
+    """
+
+    def __init__(self, plan=None, casts=None):
+        self.plan = plan
+        self.casts = casts or {}
+
+    def normalizer(self, key, column):
+        if self.plan:
+            return lambda value: self.plan.normalize(key, value)
+
+        sample = next((v for v in column if isinstance(v, collections.abc.Mapping)), None)
+        attr = next((a for a in ('id', 'value') if sample is not None and a in sample), None)
+        if attr is None:
+            return None
+
+        return lambda value: value.get(attr) if isinstance(value, collections.abc.Mapping) else value
+
+    def changed(self, cur, new):
+        if cur == new:
+            return False
+
+        # Without a plan a value that still differs in type was not understood, the same rule as diff_records
+        return bool(self.plan) or isinstance(cur, type(new)) or new is None or cur is None
+
+    def diff(self, existing, records):
+        """ Return ``[(id, changes)]`` for every ``(id, record)`` which differs from ``existing[id]`` """
+        changes = collections.OrderedDict((obj_id, {}) for obj_id, _ in records)
+        fields = {k for _, record in records for k in record}
+
+        for key in fields:
+            rows = [(obj_id, record[key]) for obj_id, record in records if key in record]
+            column = [existing.get(obj_id, {}).get(key) for obj_id, _ in rows]
+
+            normalize = self.normalizer(key, column)
+            if normalize:
+                column = [normalize(v) for v in column]
+
+            cast = self.casts.get(key)
+            if cast:
+                column = [cast(v) if v is not None else v for v in column]
+
+            for (obj_id, new), cur in zip(rows, column):
+                if self.changed(cur, new):
+                    changes[obj_id][key] = new
+
+        return [(obj_id, changed) for obj_id, changed in changes.items() if changed]
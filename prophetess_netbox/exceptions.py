@@ -25,3 +25,13 @@ class InvalidNetboxOperation(NetboxPluginException):
 class NetboxOperationFailed(NetboxPluginException):
     """Raised when aionetbox errors"""
     pass
+
+
+class GraphQLQueryFailed(NetboxPluginException):
+    """Raised when a Netbox GraphQL query returns errors"""
+    pass
+
+
+class CassetteMiss(NetboxPluginException):
+    """Raised when a replayed request was never recorded"""
+    pass
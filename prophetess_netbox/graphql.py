@@ -0,0 +1,84 @@
+"""Resolve Netbox lookups through the GraphQL API."""
+
+import re
+import json
+import logging
+
+from prophetess_netbox.exceptions import InvalidPKConfig
+
+log = logging.getLogger('prophetess.plugins.netbox.graphql')
+
+
+def literal(value):
+    """ Render a python value as a GraphQL literal """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+
+    if isinstance(value, int):
+        return str(value)
+
+    return json.dumps(str(value))
+
+
+def alias(name):
+    """ Turn an arbitrary string into a valid GraphQL alias """
+    return re.sub(r'\W', '_', name)
+
+
+class GraphQLLookup:
+    """ Compile pk/fk lookups into a single aliased GraphQL query
+
+    Each lookup is ``alias -> (model, params)``, eg: ``{'pk': ('sites', {'slug': 'nb-slug'})}``. Netbox names its
+    list queries after the singular model (``site_list``, ``ip_address_list``); ``names`` overrides that guess.
+    """
+
+    def __init__(self, client, names=None):
+        self.client = client
+        self.names = names or {}
+
+    def field(self, model):
+        if model in self.names:
+            return '{}_list'.format(self.names[model])
+
+        name = model.replace('-', '_')
+        for plural, singular in (('ies', 'y'), ('sses', 'ss'), ('xes', 'x'), ('s', '')):
+            if name.endswith(plural):
+                name = name[:-len(plural)] + singular
+                break
+
+        return '{}_list'.format(name)
+
+    @staticmethod
+    def supported(params):
+        """ Custom field filters are not exposed through GraphQL, those need to be looked up over REST """
+        if not params:
+            return False
+
+        return all(not k.startswith('cf_') and v is not None for k, v in params.items())
+
+    def compile(self, lookups):
+        queries = []
+        for name, (model, params) in lookups.items():
+            args = ', '.join('{}: {}'.format(k, literal(v)) for k, v in params.items())
+            queries.append('  {}: {}({}) {{ id }}'.format(name, self.field(model), args))
+
+        return 'query {{\n{}\n}}'.format('\n'.join(queries))
+
+    async def resolve(self, lookups):
+        """ Return ``alias -> id`` for every lookup, None where nothing matched """
+        if not lookups:
+            return {}
+
+        data = await self.client.graphql(self.compile(lookups))
+
+        output = {}
+        for name, (model, params) in lookups.items():
+            results = data.get(name) or []
+
+            if len(results) > 1:
+                kwargs = ', '.join('{}={}'.format(k, v) for k, v in params.items())
+                raise InvalidPKConfig('Not enough criteria for <{}({})>'.format(model, kwargs))
+
+            output[name] = int(results[0]['id']) if results else None
+
+        return output
@@ -0,0 +1,77 @@
+"""Hedged requests for read-only Netbox lookups."""
+
+import time
+import asyncio
+import logging
+import collections
+
+log = logging.getLogger('prophetess.plugins.netbox.hedge')
+
+
+class HedgePolicy:
+    """ Send a duplicate of slow read requests, first response wins
+
+    A request is hedged once it has been outstanding longer than ``percentile`` of recently observed latencies
+    (never sooner than ``min_delay`` seconds). At most ``max_rate`` of all requests are hedged.
+    """
+
+    def __init__(self, *, percentile=95, min_delay=0.05, max_rate=0.1, window=200, min_samples=20):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.samples = collections.deque(maxlen=window)
+
+        self.requests = 0
+        self.hedged = 0
+
+    def delay(self):
+        """ Seconds to wait before hedging, None until enough samples have been observed """
+        if len(self.samples) < self.min_samples:
+            return None
+
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+
+        return max(self.min_delay, ordered[idx])
+
+    def allow(self):
+        return self.hedged + 1 <= self.requests * self.max_rate
+
+    async def run(self, func, **params):
+        """ Await ``func(**params)``, hedging it with a duplicate call if it is slow """
+        self.requests += 1
+        start = time.monotonic()
+        delay = self.delay()
+
+        tasks = [asyncio.ensure_future(func(**params))]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.allow():
+                    log.debug(f'Hedging request after {delay:.3f}s')
+                    self.hedged += 1
+                    tasks.append(asyncio.ensure_future(func(**params)))
+
+            result = await self._first(tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+
+        self.samples.append(time.monotonic() - start)
+        return result
+
+    @staticmethod
+    async def _first(tasks):
+        """ Result of the first task to succeed, or the first error if all fail """
+        pending = set(tasks)
+        error = None
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    return t.result()
+                error = error or t.exception()
+
+        raise error
@@ -0,0 +1,267 @@
+"""Compact local pk indexes of Netbox models."""
+
+import math
+import heapq
+import bisect
+import hashlib
+import collections
+import collections.abc
+
+from array import array
+
+
+def field(obj, name):
+    if isinstance(obj, collections.abc.Mapping):
+        return obj.get(name)
+
+    return getattr(obj, name, None)
+
+
+# Filters known to be an exact match on one field of the object. Others may match differently than ``extract``:
+# ``address`` ignores the mask, ``parent`` is containment, ``serial`` and ``mac_address`` ignore case, ``region_id``
+# includes child regions and custom field filters can be partial matches.
+equality = (
+    'id',
+    'slug',
+    'name',
+    'asset_tag',
+    'cid',
+    'vid',
+    'rd',
+    'site_id',
+    'tenant_id',
+    'rack_id',
+    'device_id',
+    'device_type_id',
+    'manufacturer_id',
+    'virtual_machine_id',
+    'cluster_id',
+    'vrf_id',
+)
+
+
+def indexable(name, extra=()):
+    """ Whether the lookup param ``name`` is an exact match ``extract`` can evaluate, ``extra`` are known to be """
+    return name in equality or name in extra
+
+
+def extract(obj, name):
+    """ Value of a Netbox object matching what the lookup param ``name`` filters on
+
+    ``cf_<x>`` reads custom field ``x``, ``<x>_id`` reads the id of nested object ``x``. Nested objects and choices
+    are reduced to the value Netbox filters them by: slug, value, name or id, in that order.
+    """
+    if name.startswith('cf_'):
+        return field(field(obj, 'custom_fields') or {}, name[3:])
+
+    if name.endswith('_id'):
+        nested = field(obj, name[:-3])
+        if nested is not None:
+            return field(nested, 'id')
+
+    value = field(obj, name)
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+
+    for attr in ('slug', 'value', 'name', 'id'):
+        if field(value, attr) is not None:
+            return field(value, attr)
+
+    return value
+
+
+# Id held for a key shared by several objects, Netbox ids are positive
+ambiguous = -1
+
+
+def index_key(names, params):
+    """ Stable 64bit hash of lookup params, they are strings on the wire so compare them as such """
+    raw = '\x1f'.join(str(params.get(n)) for n in names).encode()
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), 'little', signed=True)
+
+
+class BloomFilter:
+    """ Fixed size Bloom filter over 64bit hashes """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(self.size // 8 + 1)
+
+    def _positions(self, h):
+        h1, h2 = h & 0xffffffff, (h >> 32) & 0xffffffff
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, h):
+        for p in self._positions(h):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, h):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(h))
+
+
+class ModelIndex:
+    """ Maps lookup params of a model's objects to their ids
+
+    Keys are kept as 64bit hashes in two sorted arrays (hashes and ids), 16 bytes per object. Objects added
+    after a ``freeze`` sit in a small dict until it grows past an eighth of the arrays and is merged in, removed
+    objects are only marked until then. A complete index holds the whole model, so a miss means the object does not
+    exist; an optional Bloom filter rejects most of those misses before the search. A key shared by several objects
+    maps to ``ambiguous``, such a lookup has to be answered by Netbox.
+    """
+
+    merge_threshold = 1024
+    chunk_size = 65536
+
+    def __init__(self, endpoint, model, names, bloom=False):
+        self.endpoint = endpoint
+        self.model = model
+        self.names = tuple(names)
+        self.complete = False
+        self.marker = None
+        self.checked = None
+        self.bloom = BloomFilter(0) if bloom else None
+
+        self.hashes = array('q')
+        self.ids = array('q')
+        self.sorted = True
+        self.recent = {}
+        self.recent_ids = {}
+        self.removed = set()
+
+    def __len__(self):
+        dropped = sum(i in self.removed for i in self.ids) if self.removed else 0
+        return len(self.ids) - dropped + len(self.recent)
+
+    def items(self):
+        """ Every ``(hash, id)`` pair held """
+        yield from ((h, i) for h, i in zip(self.hashes, self.ids) if i not in self.removed)
+        yield from self.recent.items()
+
+    def key(self, obj):
+        return index_key(self.names, {n: extract(obj, n) for n in self.names})
+
+    def extend(self, pairs):
+        """ Bulk load ``(hash, id)`` pairs """
+        for h, obj_id in pairs:
+            self.hashes.append(h)
+            self.ids.append(obj_id)
+
+        self.sorted = not self.hashes
+
+    def runs(self):
+        """ The arrays as sorted runs of ``(hash, id)``, sorting ``chunk_size`` rows at a time into arrays """
+        if self.sorted:
+            yield zip(self.hashes, self.ids)
+            return
+
+        for start in range(0, len(self.hashes), self.chunk_size):
+            hashes, ids = self.hashes[start:start + self.chunk_size], self.ids[start:start + self.chunk_size]
+            order = sorted(range(len(hashes)), key=hashes.__getitem__)
+            yield zip(array('q', (hashes[i] for i in order)), array('q', (ids[i] for i in order)))
+
+    def freeze(self):
+        """ Merge recent additions and sort the arrays, rebuilding the Bloom filter to fit
+
+        Sorted runs are merged into new arrays, so no per-row Python objects are held for the whole model. Removed
+        entries are dropped and every hash is kept once. A hash held by several objects becomes ``ambiguous``, unless
+        a recent addition replaced it.
+        """
+        runs = [((h, 0, i) for h, i in run if i not in self.removed) for run in self.runs()]
+        runs.append((h, 1, i) for h, i in sorted(self.recent.items()))
+
+        hashes, ids = array('q'), array('q')
+        for h, recent, obj_id in heapq.merge(*runs):
+            if hashes and hashes[-1] == h:
+                if recent:
+                    ids[-1] = obj_id
+                elif ids[-1] != obj_id:
+                    ids[-1] = ambiguous
+                continue
+
+            hashes.append(h)
+            ids.append(obj_id)
+
+        self.hashes, self.ids = hashes, ids
+        self.sorted = True
+        self.recent = {}
+        self.recent_ids = {}
+        self.removed = set()
+
+        if self.bloom is not None:
+            self.bloom = BloomFilter(int(len(self.hashes) * 1.2))
+            for h in self.hashes:
+                self.bloom.add(h)
+
+    def _find(self, h):
+        pos = bisect.bisect_left(self.hashes, h)
+        if pos < len(self.hashes) and self.hashes[pos] == h:
+            return pos
+
+        return None
+
+    def lookup(self, h):
+        if self.bloom is not None and h not in self.bloom:
+            return None
+
+        if h in self.recent:
+            return self.recent[h]
+
+        pos = self._find(h)
+        if pos is None or self.ids[pos] in self.removed:
+            return None
+
+        return self.ids[pos]
+
+    def get(self, params):
+        """ Id of the object matching params, ``ambiguous`` if several do, or None """
+        return self.lookup(index_key(self.names, params))
+
+    def insert(self, h, obj_id, replace=True):
+        """ Map a hash to an id, without ``replace`` a hash already held by another object becomes ``ambiguous`` """
+        current = self.lookup(h)
+        if current == obj_id:
+            return
+
+        if current is not None and not replace:
+            if current == ambiguous:
+                return
+            obj_id = ambiguous
+
+        pos = self._find(h)
+        if pos is not None and obj_id not in self.removed:
+            self.ids[pos] = obj_id
+        else:
+            if h in self.recent:
+                self.recent_ids.pop(self.recent[h], None)
+            self.recent[h] = obj_id
+            self.recent_ids[obj_id] = h
+
+        if self.bloom is not None:
+            self.bloom.add(h)
+
+        if len(self.recent) > max(self.merge_threshold, len(self.ids) // 8):
+            self.freeze()
+
+    def resolve(self, params, obj_id):
+        """ Remember the id a lookup resolved to, Netbox found it to be the only match """
+        self.insert(index_key(self.names, params), obj_id)
+
+    def add(self, obj, created=False):
+        obj_id = field(obj, 'id')
+        h = self.key(obj)
+
+        if self.lookup(h) != obj_id:
+            # An updated object may have been renamed, drop any stale key before adding the new one
+            if not created:
+                self.remove(obj_id)
+            self.insert(h, obj_id, replace=False)
+
+    def remove(self, obj_id):
+        """ Drop an object, its array entry is only marked and is dropped at the next ``freeze`` """
+        h = self.recent_ids.pop(obj_id, None)
+        if h is not None:
+            del self.recent[h]
+
+        self.removed.add(obj_id)
@@ -1,13 +1,24 @@
 
+import time
 import logging
 import collections
+import collections.abc
 
 from aionetbox.api import NetboxResponseObject
 from aionetbox.exceptions import AIONetboxException
 
 from prophetess.plugin import Loader
+from prophetess.exceptions import ProphetessException
 from prophetess_netbox.client import NetboxClient
-from prophetess_netbox.exceptions import NetboxOperationFailed
+from prophetess_netbox.checkpoint import Checkpoint
+from prophetess_netbox.coalesce import Coalescer, Periodic
+from prophetess_netbox.diff import BatchDiff
+from prophetess_netbox.graphql import GraphQLLookup, alias
+from prophetess_netbox.report import RunReport
+from prophetess_netbox.schema import FieldPlan
+from prophetess_netbox.trace import Tracer, null_trace
+from prophetess_netbox.webhook import WebhookReceiver
+from prophetess_netbox.exceptions import InvalidNetboxOperation, NetboxOperationFailed
 
 
 log = logging.getLogger('prophetess.plugins.netbox.loader')
@@ -28,12 +39,77 @@ class NetboxLoader(Loader):
         'pk',
     )
 
-    def __init__(self, **kwargs):
-        """ NetboxLoader init """
+    def __init__(self, *, client=None, **kwargs):
+        """ NetboxLoader init, optionally sharing the client of another loader """
         super().__init__(**kwargs)
 
         self.update_method = self.config.get('update_method', 'update')
-        self.client = NetboxClient(host=self.config.get('host'), api_key=self.config.get('api_key'))
+        self.owns_client = client is None
+        if client is None:
+            client_options = {k: self.config[k] for k in ('hedge', 'transport', 'lookup') if k in self.config}
+            client = NetboxClient(
+                host=self.config.get('host'),
+                api_key=self.config.get('api_key'),
+                **client_options
+            )
+        self.client = client
+        self.plan = None
+        if self.config.get('schema'):
+            self.plan = FieldPlan.from_operations(
+                self.client.spec(self.config.get('endpoint'), self.config.get('model'), 'create'),
+                self.client.spec(self.config.get('endpoint'), self.config.get('model'), 'read'),
+            )
+
+        self.tracer = None
+        if 'trace' in self.config:
+            self.tracer = Tracer(transport=self.client.transport, **self.config['trace'])
+
+        self.report = None
+        if self.config.get('report'):
+            options = self.config['report']
+            self.report = RunReport(**(options if isinstance(options, collections.abc.Mapping) else {}))
+
+        self.checkpoint = None
+        if 'checkpoint' in self.config:
+            self.checkpoint = Checkpoint(**self.config['checkpoint'])
+
+        self.batch = None
+        self.batch_size = None
+        if 'batch' in self.config and self.update_method != 'partial_update':
+            log.warning('Batching is only supported with update_method partial_update, ignoring it')
+        elif 'batch' in self.config:
+            ignored = [k for k in ('graphql', 'trace') if self.config.get(k)]
+            if ignored:
+                log.warning('Batched records are looked up over REST and not traced, ignoring {}'.format(
+                    ', '.join(ignored)))
+                self.tracer = None
+
+            self.batch = collections.OrderedDict()
+            self.batch_size = self.config['batch'].get('size', 100)
+            self.batch_wait = self.config['batch'].get('max_wait', 5.0)
+            self.batch_started = None
+            self.batch_timer = Periodic(self._flush_batch, self.batch_wait / 2 if self.batch_wait else None)
+            self.differ = BatchDiff(self.plan, {k: casts.get(t) for k, t in self.config.get('cast', {}).items()})
+
+        self.coalescer = None
+        if 'coalesce' in self.config:
+            flush = self.enqueue if self.batch is not None else self.process
+            self.coalescer = Coalescer(flush, **self.config['coalesce'])
+
+        self.webhook = None
+        if 'webhook' in self.config:
+            self.webhook = WebhookReceiver(self.client.lookup, **self.config['webhook'])
+
+        self.preflight = None
+        self.prepared = False
+        if self.config.get('preflight'):
+            options = self.config['preflight']
+            self.preflight = options if isinstance(options, collections.abc.Mapping) else {}
+
+        self.graphql = None
+        if self.config.get('graphql') and self.batch is None:
+            options = self.config['graphql'] if isinstance(self.config['graphql'], collections.abc.Mapping) else {}
+            self.graphql = GraphQLLookup(self.client, **options)
 
     def sanitize_config(self, config):
         """ Overload Loader.sanitize_config to add additional conditioning """
@@ -47,21 +123,50 @@ class NetboxLoader(Loader):
 
         return config
 
-    async def parse_fk(self, record):
+    def targets(self):
+        """ Every model this loader touches as ``(endpoint, model, actions, lookup names)`` """
+        def names(pk):
+            return tuple(k for item in pk for k in ([item] if isinstance(item, str) else item))
+
+        actions = {'list', 'create', self.update_method}
+        if self.update_method == 'partial_update':
+            actions.add('read')
+
+        targets = [(self.config.get('endpoint'), self.config.get('model'), sorted(actions), ())]
+
+        extracts = self.config.get('fk')
+        if extracts and isinstance(extracts, collections.abc.Mapping):
+            for rules in extracts.values():
+                targets.append((rules.get('endpoint'), rules.get('model'), ['list'], names(rules.get('pk', []))))
+
+        return targets
+
+    async def prepare(self):
+        """ Resolve every operation and warm the client before the first record """
+        await self.client.prepare(self.targets(), prefetch=self.preflight.get('prefetch'))
+        self.prepared = True
+
+    async def parse_fk(self, record, trace=null_trace, resolved=None):
         extracts = self.config.get('fk')
-        if not extracts or not isinstance(extracts, collections.Mapping):
+        if not extracts or not isinstance(extracts, collections.abc.Mapping):
             return record
 
+        resolved = resolved or {}
         for key, rules in extracts.items():
             if key not in record:
                 log.debug('Skipping FK lookup "{}". Not found in record'.format(key))
                 continue
 
-            r = await self.client.entity(
-                endpoint=rules.get('endpoint'),
-                model=rules.get('model'),
-                params=self.build_params(rules.get('pk', []), record)
-            )
+            if key in resolved:
+                record[key] = resolved[key]
+                continue
+
+            with trace.span(f'fk.{key}'):
+                r = await self.client.entity(
+                    endpoint=rules.get('endpoint'),
+                    model=rules.get('model'),
+                    params=self.build_params(rules.get('pk', []), record)
+                )
 
             if not r:
                 log.debug('FK lookup for {} ({}) failed, no record found'.format(key, record.get(key)))
@@ -72,24 +177,67 @@ class NetboxLoader(Loader):
 
         return record
 
+    async def parse_graphql(self, record, params, trace=null_trace):
+        """ Resolve the existing record and all FKs in a single GraphQL query
+
+        Lookups GraphQL can't express (custom field filters) fall back to REST. The existing record is only fetched
+        over GraphQL when just its id is needed, ``partial_update`` needs the full object to diff against.
+        """
+        lookups = {}
+        if self.update_method != 'partial_update' and self.graphql.supported(params):
+            lookups['pk'] = (self.config.get('model'), params)
+
+        extracts = self.config.get('fk')
+        fks = {}
+        if extracts and isinstance(extracts, collections.abc.Mapping):
+            for key, rules in extracts.items():
+                fk_params = self.build_params(rules.get('pk', []), record) if key in record else None
+
+                if fk_params and self.graphql.supported(fk_params):
+                    fks[key] = alias('fk_{}'.format(key))
+                    lookups[fks[key]] = (rules.get('model'), fk_params)
+
+        with trace.span('graphql'):
+            ids = await self.graphql.resolve(lookups)
+
+        if 'pk' in lookups:
+            er = None
+            if ids['pk'] is not None:
+                er = NetboxResponseObject.from_response(data={'id': ids['pk']}, type='object')
+        else:
+            with trace.span('pk'):
+                er = await self.client.entity(
+                    endpoint=self.config.get('endpoint'),
+                    model=self.config.get('model'),
+                    params=params,
+                    full=self.update_method == 'partial_update',
+                )
+
+        record = await self.parse_fk(record, trace, resolved={k: ids[name] for k, name in fks.items()})
+
+        return er, record
+
     def build_params(self, config, record):
         output = {}
         for item in config:
             if isinstance(item, str):
                 output[item] = record.get(item)
-            elif isinstance(item, collections.Mapping):
+            elif isinstance(item, collections.abc.Mapping):
                 for k, tpl in item.items():
                     output[k] = tpl.format(**record)
 
         return output
 
     def sanitize_record(self, record):
+        if self.plan:
+            record = {k: self.plan.cast(k, v) for k, v in record.items()}
+
         if 'cast' not in self.config:
             return record
 
         for el, t in self.config['cast'].items():
             if el not in record:
-                pass
+                continue
 
             if record[el] is None:
                 continue
@@ -113,6 +261,14 @@ class NetboxLoader(Loader):
             if isinstance(cur_value, NetboxResponseObject):
                 cur_value = cur_value.dict()
 
+            # The spec says exactly how a nested value compares, no need to guess
+            if self.plan:
+                cur_value = self.plan.normalize(k, cur_value)
+                if cur_value != v:
+                    log.debug(f'{k} "{cur_value}" does not match "{v}"')
+                    changed[k] = v
+                continue
+
             # If the fields don't match perform some validation
             if cur_value != v:
 
@@ -125,7 +281,7 @@ class NetboxLoader(Loader):
                 # Netbox now returns nested dicts for simple value mappings. We can check if there's an ID field and
                 # compare there. This is the case of a linked record where an update takes just the ID but a GET of
                 # the object returns the tree of fields
-                if isinstance(cur_value, collections.Mapping):
+                if isinstance(cur_value, collections.abc.Mapping):
                     if 'id' in cur_value:
                         if cur_value['id'] != v:
                             log.debug(f"{k}.id \"{cur_value['id']}\" ({type(cur_value['id'])})"
@@ -134,16 +290,205 @@ class NetboxLoader(Loader):
 
         return changed
 
+    def outcome(self, name):
+        if self.report:
+            self.report.count(name)
+
     async def run(self, record):
         """ Overload Loader.run to execute netbox loading of a record """
 
-        er = await self.client.entity(
-            endpoint=self.config.get('endpoint'),
-            model=self.config.get('model'),
-            params=self.build_params(self.config.get('pk'), record)
-        )
+        self.outcome('seen')
+
+        if self.preflight is not None and not self.prepared:
+            await self.prepare()
+
+        if self.webhook:
+            await self.webhook.start()
+
+        params = self.build_params(self.config.get('pk'), record)
+
+        if self.coalescer:
+            return await self.coalescer.add(record, params)
+
+        if self.batch is not None:
+            return await self.enqueue(record, params)
+
+        return await self.process(record, params)
+
+    async def enqueue(self, record, params):
+        """ Hold a record for the next batch, merging it with any held record with the same pk """
+        if not self.batch:
+            self.batch_started = time.monotonic()
+
+        key = Coalescer.key(params)
+        if key in self.batch:
+            self.batch[key][0].update(record)
+        else:
+            self.batch[key] = (dict(record), params)
+
+        if self.batch_wait:
+            self.batch_timer.start()
+
+        if len(self.batch) >= self.batch_size:
+            await self.flush_batch()
+
+    async def flush_batch(self):
+        """ Write every held record, serialized so an object is never written while a flush holding it is in flight """
+        await self.batch_timer.run(force=True)
+
+    async def _flush_batch(self, force=False):
+        """ Resolve every held record, diff the existing ones in a single pass and update them in bulk
 
-        record = await self.parse_fk(record)
+        The periodic flush only writes a batch held for ``max_wait`` seconds, ``force`` writes it whatever its age.
+        New records are created one by one. A record failing its lookups is logged and dropped, like a failed record
+        of a coalesced flush, the rest of the batch is still written. Existing objects found by a list request are
+        diffed as returned, only those answered from a lookup index are fetched.
+        """
+        if not self.batch or (not force and time.monotonic() - self.batch_started < self.batch_wait):
+            return
+
+        items, self.batch = list(self.batch.values()), collections.OrderedDict()
+        endpoint, model = self.config.get('endpoint'), self.config.get('model')
+
+        existing = {}
+        updates = []
+        for record, params in items:
+            if self.checkpoint and self.checkpoint.resume(params):
+                self.outcome('resumed')
+                continue
+
+            try:
+                er = await self.client.entity(endpoint=endpoint, model=model, params=params)
+                record = await self.parse_fk(record)
+                if self.plan:
+                    record = self.plan.shape(record)
+                record = self.sanitize_record(record)
+
+                if er:
+                    # Objects answered from a lookup index only carry their id
+                    data = er.dict()
+                    if len(data) > 1:
+                        existing[er.id] = data
+
+                    updates.append((er.id, record, params))
+                    continue
+
+                result = await self.write('create', {'data': record})
+            except ProphetessException as e:
+                log.warning('Batched record {} failed: {}'.format(params, e))
+                self.outcome('failed')
+                continue
+            except Exception as e:
+                log.error('Batched record {} raised unexpected exception: {}'.format(params, e))
+                self.outcome('failed')
+                continue
+
+            self.outcome('created')
+            self.client.remember(endpoint, model, result, created=True)
+
+            if self.checkpoint:
+                self.checkpoint.mark(params, 'written', result.id)
+
+        if not updates:
+            return
+
+        missing = [i for i, _, _ in updates if i not in existing]
+        if missing:
+            existing.update(await self.client.objects(endpoint=endpoint, model=model, ids=missing))
+
+        changes = dict(self.differ.diff(existing, [(i, record) for i, record, _ in updates]))
+        log.debug('{} of {} batched records changed'.format(len(changes), len(updates)))
+
+        failed = set()
+        if changes:
+            try:
+                failed = await self.write_bulk([{'id': i, **changed} for i, changed in changes.items()])
+            except Exception:
+                for _ in changes:
+                    self.outcome('failed')
+                raise
+
+            for i, changed in changes.items():
+                if i not in failed:
+                    self.client.remember(endpoint, model, {**existing.get(i, {}), **changed})
+
+        for i, _, params in updates:
+            if i in failed:
+                self.outcome('failed')
+                continue
+
+            self.outcome('updated' if i in changes else 'unchanged')
+            if self.checkpoint:
+                self.checkpoint.mark(params, 'written' if i in changes else 'unchanged', i)
+
+    async def write_bulk(self, data):
+        """ PATCH many objects in one request, falling back to one request per object without a bulk operation
+
+        Returns the ids of objects that failed to write. Without a bulk operation a failed object is logged and the
+        rest are still written, a failed bulk request raises as nothing was written.
+        """
+        try:
+            self.client.build_model(self.config.get('endpoint'), self.config.get('model'), 'bulk_partial_update')
+        except InvalidNetboxOperation:
+            failed = set()
+            for item in data:
+                item = dict(item)
+                obj_id = item.pop('id')
+                try:
+                    await self.write('partial_update', {'id': obj_id, 'data': item})
+                except ProphetessException as e:
+                    log.warning('Batched update of {} failed: {}'.format(obj_id, e))
+                    failed.add(obj_id)
+                except Exception as e:
+                    log.error('Batched update of {} raised unexpected exception: {}'.format(obj_id, e))
+                    failed.add(obj_id)
+
+            return failed
+
+        await self.write('bulk_partial_update', {'data': data})
+        return set()
+
+    async def process(self, record, params):
+        """ Load a record, traced when tracing is enabled and skipped if already checkpointed """
+
+        if self.checkpoint and self.checkpoint.resume(params):
+            log.debug('Skipping {}, already loaded in this run'.format(params))
+            self.outcome('resumed')
+            return
+
+        trace = self.tracer.begin(params) if self.tracer else null_trace
+
+        try:
+            result = await self.load(record, params, trace)
+        except Exception:
+            self.outcome('failed')
+            raise
+        finally:
+            trace.finish()
+
+        if self.checkpoint:
+            self.checkpoint.mark(params, 'written' if result else 'unchanged', getattr(result, 'id', None))
+
+        return result
+
+    async def load(self, record, params, trace=null_trace):
+        """ Look up, resolve and write a single record """
+
+        if self.graphql:
+            er, record = await self.parse_graphql(record, params, trace)
+        else:
+            with trace.span('pk'):
+                er = await self.client.entity(
+                    endpoint=self.config.get('endpoint'),
+                    model=self.config.get('model'),
+                    params=params,
+                    full=self.update_method == 'partial_update',
+                )
+
+            record = await self.parse_fk(record, trace)
+
+        if self.plan:
+            record = self.plan.shape(record)
 
         payload = {
             'data': record
@@ -155,23 +500,68 @@ class NetboxLoader(Loader):
             payload['id'] = er.id
 
         if method == 'partial_update':
-            er = self.sanitize_record(er.dict())
-            record = self.sanitize_record(record)
-            changed_record = self.diff_records(er, record)
+            with trace.span('diff'):
+                er = self.sanitize_record(er.dict())
+                record = self.sanitize_record(record)
+                changed_record = self.diff_records(er, record)
+
             if not changed_record:
                 log.debug('Skipping {} as no data has changed'.format(record))
+                self.outcome('unchanged')
                 return
 
             payload['data'] = changed_record
 
+        result = await self.write(method, payload, trace)
+        self.outcome('created' if method == 'create' else 'updated')
+
+        self.client.remember(self.config.get('endpoint'), self.config.get('model'), result, created=method == 'create')
+        return result
+
+    async def write(self, method, payload, trace=null_trace):
         func = self.client.build_model(self.config.get('endpoint'), self.config.get('model'), method)
 
         log.debug(f'Running {method} with payload: {payload}')
+        start = time.monotonic()
         try:
-            return await func(**payload)
+            with trace.span('write'):
+                return await func(**payload)
         except AIONetboxException as e:
             log.debug(f'Failed to {method}')
             raise NetboxOperationFailed(str(e))
+        finally:
+            if self.report:
+                self.report.written(method, time.monotonic() - start)
 
     async def close(self):
-        await self.client.close()
+        if self.coalescer:
+            await self.coalescer.close()
+
+        if self.batch is not None:
+            self.batch_timer.stop()
+
+        # Whatever happens to the last batch, everything below still has to be closed
+        if self.batch:
+            try:
+                await self.flush_batch()
+            except ProphetessException as e:
+                log.warning('Final batch flush failed: {}'.format(e))
+            except Exception as e:
+                log.error('Final batch flush raised unexpected exception: {}'.format(e))
+
+        if self.webhook:
+            await self.webhook.stop()
+
+        if self.checkpoint:
+            self.checkpoint.close()
+
+        # A loader sharing another loader's client doesn't own its request figures, that loader reports them
+        if self.report and self.owns_client:
+            self.report.emit(self.report.summary(
+                transport=self.client.transport,
+                stats=self.client.stats,
+                model='{}.{}'.format(self.config.get('endpoint'), self.config.get('model')),
+            ))
+
+        if self.owns_client:
+            await self.client.close()
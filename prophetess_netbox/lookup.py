@@ -0,0 +1,267 @@
+"""Choose how records are looked up in Netbox."""
+
+import math
+import time
+import asyncio
+import logging
+
+from prophetess_netbox.index import ModelIndex, field, indexable
+from prophetess_netbox.store import IndexStore
+from prophetess_netbox.exceptions import NetboxPluginException
+
+log = logging.getLogger('prophetess.plugins.netbox.lookup')
+
+# Seconds before an index is revalidated, Prophetess re-runs pipelines in the same process
+default_ttl = 60
+
+
+class Target:
+    """ Lookup statistics for a single model and set of lookup params """
+
+    def __init__(self, endpoint, model, names):
+        self.endpoint = endpoint
+        self.model = model
+        self.names = names
+        self.lookups = 0
+        self.count = None
+        self.lock = asyncio.Lock()
+
+
+class LookupPlanner:
+    """ Pick per-record lookups or a full prefetch of a model
+
+    ``record`` always asks Netbox, ``prefetch`` loads the whole model into a local index on first use and ``auto``
+    decides per model from its size. A prefetch costs ``count / page_size`` requests, so with an ``expected`` number of
+    records it prefetches up front when that is cheaper. Without one it switches to a prefetch once the lookups already
+    made match what the prefetch would cost.
+
+    With ``cache`` (implied by ``store``) ids resolved by per-record lookups are kept as well. A ``store`` persists
+    indexes between runs; a stored index is validated against its model's marker before use. Every index is
+    revalidated every ``ttl`` seconds, ``None`` trusts it for the life of the process.
+
+    Only lookups on params known to be exact field matches are answered locally, ``fields`` adds params of a model
+    (``{'<endpoint>.<model>': [names]}``), such as custom fields with exact filter logic.
+    """
+
+    strategies = ('record', 'prefetch', 'auto')
+
+    def __init__(self, client, *, strategy='record', expected=None, page_size=1000, bloom=False, cache=False,
+                 store=None, ttl=default_ttl, fields=None):
+        if strategy not in self.strategies:
+            raise NetboxPluginException('Unknown lookup strategy {}'.format(strategy))
+
+        self.client = client
+        self.strategy = strategy
+        self.expected = expected
+        self.page_size = page_size
+        self.bloom = bloom
+        self.cache = cache or bool(store)
+        self.store = IndexStore(store, client.host) if store else None
+        self.ttl = ttl
+        self.fields = {k.lower(): tuple(v) for k, v in (fields or {}).items()}
+
+        self.targets = {}
+        self.indexes = {}
+        self.preloaded = set()
+
+    def indexable(self, endpoint, model, names):
+        extra = self.fields.get('{}.{}'.format(endpoint, model), ())
+        return bool(names) and all(indexable(name, extra) for name in names)
+
+    def target(self, endpoint, model, names):
+        key = (endpoint, model, names)
+        if key not in self.targets:
+            self.targets[key] = Target(endpoint, model, names)
+
+        return self.targets[key]
+
+    async def index(self, *, endpoint, model, params):
+        """ Return the local index for this lookup, or None if Netbox should be asked
+
+        Only a complete index can answer a miss; a miss in a cache index still needs to be looked up.
+        """
+        # Only a lookup which exactly matches fields of the object can be answered locally
+        if not self.indexable(endpoint, model, params):
+            return None
+
+        names = tuple(sorted(params))
+        key = (endpoint, model, names)
+        idx = self.indexes.get(key)
+
+        # Preloaded indexes are used whatever the strategy
+        if idx is None and self.strategy == 'record' and not self.cache:
+            return None
+
+        target = self.target(endpoint, model, names)
+        target.lookups += 1
+
+        if idx is not None and idx.complete and not self.expired(idx):
+            return idx
+
+        async with target.lock:
+            idx = self.indexes.get(key)
+
+            if idx is None and self.store:
+                idx = self.store.load(endpoint, model, names, bloom=self.bloom)
+
+            if idx is not None and (idx.checked is None or self.expired(idx)):
+                idx = await self.validate(idx)
+                if idx is None:
+                    self.indexes.pop(key, None)
+
+                # A preloaded index is used whatever the strategy, so it's rebuilt rather than given up
+                if idx is None and key in self.preloaded:
+                    idx = await self.prefetch(target)
+
+            if (idx is None or not idx.complete) and self.strategy != 'record' and await self.should_prefetch(target):
+                idx = await self.prefetch(target)
+
+            if idx is None and self.cache:
+                idx = ModelIndex(endpoint, model, names, bloom=self.bloom)
+                await self.mark(idx)
+
+            if idx is not None:
+                self.indexes[key] = idx
+
+        return idx
+
+    def expired(self, idx):
+        return self.ttl is not None and time.monotonic() - idx.checked > self.ttl
+
+    async def mark(self, idx):
+        """ Snapshot the model's marker, only needed if the index will be validated later """
+        idx.checked = time.monotonic()
+        if self.store or self.ttl is not None:
+            idx.marker = await self.client.marker(endpoint=idx.endpoint, model=idx.model)
+
+    async def validate(self, idx):
+        """ Bring an index up to date with changes made since its marker, None if it can't be trusted anymore
+
+        Objects updated since the marker are re-indexed. New objects have ids above the marker's ``max_id``, so if
+        the model's count differs from the old count plus those, objects were deleted and the index is dropped.
+        """
+        old = idx.marker or {}
+        await self.mark(idx)
+
+        if idx.marker == old:
+            return idx
+
+        if not old.get('last_updated'):
+            return None
+
+        created = 0
+        pages = self.client.pages(
+            endpoint=idx.endpoint,
+            model=idx.model,
+            params={'last_updated__gte': old['last_updated'], 'limit': self.page_size},
+        )
+        async for page in pages:
+            for obj in page:
+                new = obj['id'] > (old.get('max_id') or 0)
+                created += new
+
+                if idx.complete:
+                    idx.add(obj, created=new)
+                elif not new:
+                    idx.remove(obj['id'])
+
+        if idx.marker['count'] != old.get('count', 0) + created:
+            log.debug('Objects were removed from {}.{}, dropping its index'.format(idx.endpoint, idx.model))
+            return None
+
+        log.debug('Applied {} changes to {}.{} index'.format(created, idx.endpoint, idx.model))
+        return idx
+
+    async def should_prefetch(self, target):
+        if self.strategy == 'prefetch':
+            return True
+
+        if target.count is None:
+            target.count = await self.client.count(endpoint=target.endpoint, model=target.model)
+
+        pages = max(1, math.ceil(target.count / self.page_size))
+
+        if self.expected is not None and target.lookups == 1:
+            return pages < self.expected
+
+        return target.lookups >= pages
+
+    async def prefetch(self, target):
+        log.debug('Prefetching {}.{} for lookups on {}'.format(target.endpoint, target.model, target.names))
+
+        idx = ModelIndex(target.endpoint, target.model, target.names, bloom=self.bloom)
+        await self.mark(idx)
+
+        # Only the keys are kept, each page of objects is dropped as soon as it has been indexed
+        pages = self.client.pages(endpoint=target.endpoint, model=target.model, params={'limit': self.page_size})
+        async for page in pages:
+            idx.extend((idx.key(obj), obj['id']) for obj in page)
+
+        idx.freeze()
+        idx.complete = True
+        return idx
+
+    async def preload(self, endpoint, model, names, *, max_count):
+        """ Prefetch a model ahead of its first lookup if it has no more than ``max_count`` objects
+
+        Like any index it is revalidated every ``ttl`` seconds, and prefetched again if objects were deleted.
+        """
+        names = tuple(sorted(names))
+        if not self.indexable(endpoint, model, names):
+            return None
+
+        key = (endpoint, model, names)
+        target = self.target(endpoint, model, names)
+
+        async with target.lock:
+            if key in self.indexes:
+                return self.indexes[key]
+
+            if target.count is None:
+                target.count = await self.client.count(endpoint=endpoint, model=model)
+
+            if target.count > max_count:
+                return None
+
+            self.indexes[key] = await self.prefetch(target)
+            self.preloaded.add(key)
+
+        return self.indexes[key]
+
+    def resolved(self, endpoint, model, params, obj):
+        """ Keep the result of a per-record lookup """
+        idx = self.indexes.get((endpoint, model, tuple(sorted(params))))
+        if idx is not None and obj is not None:
+            idx.resolve(params, obj.id)
+
+    def remember(self, endpoint, model, obj, created=False):
+        """ Keep indexes of a model current after an object was written """
+        obj_id = field(obj, 'id')
+        if obj_id is None:
+            return
+
+        for idx in self.indexes.values():
+            if (idx.endpoint, idx.model) != (endpoint, model):
+                continue
+
+            if idx.complete or created:
+                idx.add(obj, created=created)
+            elif idx.lookup(idx.key(obj)) != obj_id:
+                # The cached key of an updated object may be stale, it will be looked up again
+                idx.remove(obj_id)
+
+    def forget(self, endpoint, model, obj_id):
+        """ Drop a deleted object from every index of its model """
+        for idx in self.indexes.values():
+            if (idx.endpoint, idx.model) == (endpoint, model):
+                idx.remove(obj_id)
+
+    def close(self):
+        if not self.store:
+            return
+
+        for idx in self.indexes.values():
+            if idx.marker is not None:
+                self.store.save(idx)
+
+        self.store.close()
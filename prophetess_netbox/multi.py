@@ -0,0 +1,165 @@
+"""Load several related Netbox models from one record."""
+
+import asyncio
+import logging
+import collections
+import collections.abc
+
+from prophetess.plugin import Loader
+from prophetess.exceptions import InvalidConfigurationException, ProphetessException
+from prophetess_netbox.client import NetboxClient
+from prophetess_netbox.loader import NetboxLoader
+from prophetess_netbox.lookup import default_ttl
+from prophetess_netbox.report import RunReport
+
+log = logging.getLogger('prophetess.plugins.netbox.multi')
+
+# Options which only make sense once per client
+shared = ('models', 'concurrency', 'hedge', 'transport', 'lookup', 'report')
+
+# Options which rely on NetboxLoader.run, which the stages bypass, or would break the ordering between stages
+unsupported = ('batch', 'coalesce', 'preflight', 'webhook', 'checkpoint')
+
+
+class NetboxMultiLoader(Loader):
+    """ Load a list of models in dependency order, sharing one client, its lookup caches and a concurrency budget
+
+    Every entry of ``models`` is configured like a ``NetboxLoader`` and reads its record from ``record[key]``, ``key``
+    defaulting to the model name; a list loads several objects. A model waits for every other model its ``fk`` rules
+    point at, models that don't depend on each other are loaded concurrently. Written objects are remembered by the
+    shared lookup cache, so FK lookups of later models don't go back to Netbox. A ``report`` covers every model.
+    """
+
+    required_config = (
+        'host',
+        'api_key',
+        'models',
+    )
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        for spec in [self.config] + list(self.config['models']):
+            rejected = [k for k in unsupported if k in spec]
+            if rejected:
+                raise InvalidConfigurationException('Unsupported by NetboxMultiLoader: {}'.format(', '.join(rejected)))
+
+        # The shared cache is only on by default while it's revalidated, nothing else invalidates it here
+        lookup = dict(self.config.get('lookup', {}))
+        if lookup.get('ttl', default_ttl) is not None:
+            lookup.setdefault('cache', True)
+
+        client_options = {k: self.config[k] for k in ('hedge', 'transport') if k in self.config}
+        self.client = NetboxClient(
+            host=self.config.get('host'),
+            api_key=self.config.get('api_key'),
+            lookup=lookup,
+            **client_options
+        )
+        self.semaphore = None
+
+        self.report = None
+        if self.config.get('report'):
+            options = self.config['report']
+            self.report = RunReport(**(options if isinstance(options, collections.abc.Mapping) else {}))
+
+        defaults = {k: v for k, v in self.config.items() if k not in shared}
+        self.loaders = collections.OrderedDict()
+        for spec in self.config['models']:
+            key = spec.get('key', spec.get('model', '').lower())
+            if key in self.loaders:
+                raise InvalidConfigurationException('Duplicate model key {}, set a unique key'.format(key))
+
+            config = {**defaults, **{k: v for k, v in spec.items() if k != 'key'}}
+            self.loaders[key] = NetboxLoader(id='{}.{}'.format(self.id, key), config=config, client=self.client)
+            self.loaders[key].report = self.report
+
+        self.parents = self.build_graph()
+
+    def build_graph(self):
+        """ Map every model key to the keys of the models it depends on, in dependency order """
+        keys = collections.defaultdict(list)
+        for key, loader in self.loaders.items():
+            keys[(loader.config['endpoint'], loader.config['model'])].append(key)
+
+        parents = {}
+        for key, loader in self.loaders.items():
+            parents[key] = []
+            for rules in (loader.config.get('fk') or {}).values():
+                target = (rules.get('endpoint', '').lower(), rules.get('model', '').lower())
+                parents[key].extend(k for k in keys.get(target, []) if k != key and k not in parents[key])
+
+        ordered = collections.OrderedDict()
+        while len(ordered) < len(parents):
+            ready = [k for k, p in parents.items() if k not in ordered and all(i in ordered for i in p)]
+            if not ready:
+                cycle = ', '.join(k for k in parents if k not in ordered)
+                raise InvalidConfigurationException('Models depend on each other: {}'.format(cycle))
+
+            for k in ready:
+                ordered[k] = parents[k]
+
+        return ordered
+
+    async def stage(self, key, record, parents):
+        """ Load one model of a record once every model it depends on has been loaded """
+        if parents:
+            await asyncio.wait(parents)
+            if any(p.exception() for p in parents):
+                log.debug('Skipping {}, a model it depends on failed'.format(key))
+                return
+
+        items = record.get(key)
+        if not items:
+            return
+
+        loader = self.loaders[key]
+
+        async def load(item):
+            if self.report:
+                self.report.count('seen')
+
+            async with self.semaphore:
+                params = loader.build_params(loader.config.get('pk'), item)
+                return await loader.process(dict(item), params)
+
+        if isinstance(items, list):
+            return await asyncio.gather(*(load(item) for item in items))
+
+        return await load(items)
+
+    async def run(self, record):
+        """ Overload Loader.run to load every configured model of a record """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.config.get('concurrency', 10))
+
+        tasks = collections.OrderedDict()
+        for key, parents in self.parents.items():
+            tasks[key] = asyncio.ensure_future(self.stage(key, record, [tasks[p] for p in parents]))
+
+        await asyncio.wait(tasks.values())
+
+        failed = [(key, task.exception()) for key, task in tasks.items() if task.exception()]
+        for key, e in failed[1:]:
+            if isinstance(e, ProphetessException):
+                log.warning('{} Loader failed: {}'.format(self.loaders[key].id, e))
+            else:
+                log.error('{} raised unexpected exception: {}'.format(self.loaders[key].id, e))
+
+        if failed:
+            raise failed[0][1]
+
+        return {key: task.result() for key, task in tasks.items()}
+
+    async def close(self):
+        for loader in self.loaders.values():
+            await loader.close()
+
+        if self.report:
+            self.report.emit(self.report.summary(
+                transport=self.client.transport,
+                stats=self.client.stats,
+                model=', '.join('{endpoint}.{model}'.format(**loader.config) for loader in self.loaders.values()),
+            ))
+
+        await self.client.close()
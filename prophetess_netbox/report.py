@@ -0,0 +1,97 @@
+"""Summary of what a loader did during a run."""
+
+import json
+import time
+import logging
+import collections
+
+log = logging.getLogger('prophetess.plugins.netbox.report')
+
+# HTTP methods as the transport counts them, GraphQL queries are POSTs as well
+kinds = {
+    'GET': 'list',
+    'POST': 'create',
+    'PUT': 'update',
+    'PATCH': 'update',
+    'DELETE': 'delete',
+}
+
+
+class RunReport:
+    """ Counts record outcomes and write time, and summarizes them with the client's request and lookup figures
+
+    GraphQL queries, which the transport counts as ``POST``, are taken from the client's ``graphql`` stats and
+    reported on their own. Lookup time is the time spent in the client's lookups, write time the time spent in create
+    and update requests.
+    """
+
+    outcomes = ('seen', 'created', 'updated', 'unchanged', 'failed', 'resumed')
+
+    def __init__(self, *, path=None, slowest=5):
+        self.path = path
+        self.slowest = slowest
+        self.started = time.monotonic()
+        self.records = collections.Counter()
+        self.writes = collections.Counter()
+
+    def count(self, outcome):
+        self.records[outcome] += 1
+
+    def written(self, method, elapsed):
+        self.writes[method] += elapsed
+
+    @staticmethod
+    def ratio(a, b):
+        return round(a / b, 3) if b else None
+
+    def summary(self, *, transport, stats, model):
+        requests = collections.Counter()
+        for method, n in transport.requests.items():
+            requests[kinds.get((method or '').upper(), 'other')] += n
+
+        queries = stats.get(('graphql', 'query'), {}).get('lookups', 0)
+        if queries:
+            requests['create'] -= queries
+            requests['graphql'] = queries
+            if requests['create'] <= 0:
+                del requests['create']
+
+        total = sum(requests.values())
+        lookups = sum(s['lookups'] for s in stats.values())
+        hits = sum(s['hits'] for s in stats.values())
+        lookup_time = sum(s['time'] for s in stats.values())
+
+        targets = sorted(stats.items(), key=lambda i: i[1]['time'], reverse=True)[:self.slowest]
+
+        return {
+            'model': model,
+            'elapsed': round(time.monotonic() - self.started, 3),
+            'records': {k: self.records[k] for k in self.outcomes},
+            'requests': {'total': total, **requests},
+            'requests_per_record': self.ratio(total, self.records['seen']),
+            'cache_hit_ratio': self.ratio(hits, lookups),
+            'time': {
+                'lookup': round(lookup_time, 3),
+                'write': round(sum(self.writes.values()), 3),
+                'write_by_method': {k: round(v, 3) for k, v in self.writes.items()},
+            },
+            'slowest': [
+                {
+                    'model': '{}.{}'.format(*key),
+                    'lookups': s['lookups'],
+                    'hit_ratio': self.ratio(s['hits'], s['lookups']),
+                    'time': round(s['time'], 3),
+                    'mean': self.ratio(s['time'], s['lookups']),
+                }
+                for key, s in targets
+            ],
+        }
+
+    def emit(self, summary):
+        """ Log the summary and, when ``path`` is set, write it as JSON """
+        data = json.dumps(summary, sort_keys=True)
+        log.info('Run summary: {}'.format(data))
+
+        if self.path:
+            with open(self.path, 'w') as f:
+                f.write(data + '\n')
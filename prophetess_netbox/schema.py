@@ -0,0 +1,125 @@
+"""Per-model field rules derived from the Netbox OpenAPI spec."""
+
+import logging
+import collections
+import collections.abc
+
+from prophetess.exceptions import InvalidConfigurationException
+
+log = logging.getLogger('prophetess.plugins.netbox.schema')
+
+booleans = {
+    'true': True,
+    'yes': True,
+    '1': True,
+    'false': False,
+    'no': False,
+    '0': False,
+}
+
+
+def boolean(value):
+    """ Parse a boolean, ``bool('false')`` would be True """
+    if isinstance(value, bool):
+        return value
+
+    try:
+        return booleans[str(value).strip().lower()]
+    except KeyError:
+        raise ValueError('{} is not a boolean'.format(value))
+
+
+types = {
+    'integer': int,
+    'number': float,
+    'string': str,
+    'boolean': boolean,
+}
+
+
+def body_schema(create):
+    """ Schema of a create operation's body, a ``body`` parameter (Swagger 2) or a JSON ``requestBody`` """
+    for param in create.get('parameters', []):
+        if param.get('in') == 'body':
+            return param.get('schema', {})
+
+    return create.get('requestBody', {}).get('content', {}).get('application/json', {}).get('schema', {})
+
+
+def response_schema(read):
+    response = read.get('responses', {}).get('200', {})
+    if 'schema' in response:
+        return response['schema']
+
+    return response.get('content', {}).get('application/json', {}).get('schema', {})
+
+
+class FieldPlan:
+    """ Which fields of a model are writable, how to compare them and what type they are
+
+    ``writable`` comes from the body of the create operation, minus read-only fields. ``compare`` maps fields
+    which are read back as nested objects, or lists of them, to the key written values correspond to: ``id`` for
+    related objects, ``value`` for choices.
+    """
+
+    def __init__(self, writable, compare, casts):
+        self.writable = frozenset(writable)
+        self.compare = compare
+        self.casts = casts
+
+    @classmethod
+    def from_operations(cls, create, read):
+        """ Build a plan from the spec of a model's create and read operations
+
+        Without a body schema every field would be dropped and every record written as unchanged, so that raises.
+        """
+        properties = body_schema(create).get('properties', {})
+        if not properties:
+            raise InvalidConfigurationException('No body schema found in the create operation, unable to use schema')
+
+        writable = {k for k, v in properties.items() if not v.get('readOnly')}
+        casts = {k: types[properties[k]['type']] for k in writable if properties[k].get('type') in types}
+
+        compare = {}
+        for k, v in response_schema(read).get('properties', {}).items():
+            if v.get('type') == 'array':
+                v = v.get('items', {})
+            nested = v.get('properties', {}) if v.get('type') == 'object' else {}
+            for attr in ('id', 'value'):
+                if attr in nested:
+                    compare[k] = attr
+                    break
+
+        return cls(writable, compare, casts)
+
+    def shape(self, record):
+        """ Drop read-only and unknown fields from a write payload """
+        dropped = [k for k in record if k not in self.writable]
+        if dropped:
+            log.debug('Dropping fields not writable: {}'.format(', '.join(dropped)))
+
+        return {k: v for k, v in record.items() if k in self.writable}
+
+    def cast(self, key, value):
+        cast = self.casts.get(key)
+        if cast is None or value is None or isinstance(value, (collections.abc.Mapping, list)):
+            return value
+
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            log.debug('Unable to cast {} "{}" to {}'.format(key, value, cast.__name__))
+            return value
+
+    def normalize(self, key, value):
+        """ Reduce a value read from Netbox to what would be written for it """
+        if key not in self.compare:
+            return value
+
+        if isinstance(value, collections.abc.Mapping):
+            return value.get(self.compare[key])
+
+        if isinstance(value, list):
+            return [v.get(self.compare[key]) if isinstance(v, collections.abc.Mapping) else v for v in value]
+
+        return value
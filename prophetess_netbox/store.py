@@ -0,0 +1,92 @@
+"""On-disk persistence of lookup indexes between runs."""
+
+import json
+import sqlite3
+import logging
+
+from prophetess_netbox.index import ModelIndex
+
+log = logging.getLogger('prophetess.plugins.netbox.store')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexes (
+    id INTEGER PRIMARY KEY,
+    host TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    model TEXT NOT NULL,
+    names TEXT NOT NULL,
+    complete INTEGER NOT NULL,
+    marker TEXT NOT NULL,
+    UNIQUE (host, endpoint, model, names)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    index_id INTEGER NOT NULL,
+    hash INTEGER NOT NULL,
+    obj_id INTEGER NOT NULL,
+    PRIMARY KEY (index_id, hash)
+) WITHOUT ROWID;
+"""
+
+
+class IndexStore:
+    """ SQLite file of lookup indexes keyed by host, endpoint, model and lookup params
+
+    Every index is saved with the marker (``count``, ``max_id`` and ``last_updated``) of its model at the time it
+    was built, which is what the next run validates it against.
+    """
+
+    def __init__(self, path, host):
+        self.path = path
+        self.host = host
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(SCHEMA)
+
+        return self._conn
+
+    def _row(self, endpoint, model, names):
+        return self.conn.execute(
+            'SELECT id, complete, marker FROM indexes WHERE host = ? AND endpoint = ? AND model = ? AND names = ?',
+            (self.host, endpoint, model, json.dumps(names)),
+        ).fetchone()
+
+    def load(self, endpoint, model, names, bloom=False):
+        """ Return the stored index, or None if there is none """
+        row = self._row(endpoint, model, names)
+        if not row:
+            return None
+
+        index_id, complete, marker = row
+        idx = ModelIndex(endpoint, model, names, bloom=bloom)
+        idx.extend(self.conn.execute('SELECT hash, obj_id FROM entries WHERE index_id = ?', (index_id,)))
+        idx.freeze()
+        idx.complete = bool(complete)
+        idx.marker = json.loads(marker)
+
+        log.debug('Loaded {} entries for {}.{} {}'.format(len(idx), endpoint, model, names))
+        return idx
+
+    def save(self, idx):
+        with self.conn:
+            row = self._row(idx.endpoint, idx.model, idx.names)
+            if row:
+                self.conn.execute('DELETE FROM entries WHERE index_id = ?', (row[0],))
+                self.conn.execute('DELETE FROM indexes WHERE id = ?', (row[0],))
+
+            cur = self.conn.execute(
+                'INSERT INTO indexes (host, endpoint, model, names, complete, marker) VALUES (?, ?, ?, ?, ?, ?)',
+                (self.host, idx.endpoint, idx.model, json.dumps(idx.names), int(idx.complete), json.dumps(idx.marker)),
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO entries (index_id, hash, obj_id) VALUES (?, ?, ?)',
+                ((cur.lastrowid, h, i) for h, i in idx.items()),
+            )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,129 @@
+"""Per-record phase tracing for the Netbox loader."""
+
+import json
+import time
+import logging
+import importlib
+import collections
+
+log = logging.getLogger('prophetess.plugins.netbox.trace')
+
+Span = collections.namedtuple('Span', ('name', 'duration', 'requests'))
+
+
+def load_callback(path):
+    """ Import a callback from a ``package.module:function`` string """
+    if callable(path):
+        return path
+
+    module, _, name = path.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+class _NullSpan:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class NullTrace:
+    """ Stand-in used when tracing is disabled """
+
+    def span(self, name):
+        return _NullSpan()
+
+    def finish(self):
+        pass
+
+
+null_trace = NullTrace()
+
+
+class _Span:
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        self.requests = self.trace.tracer.request_count()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        span = Span(
+            name=self.name,
+            duration=time.monotonic() - self.start,
+            requests=self.trace.tracer.request_count() - self.requests,
+        )
+        self.trace.spans.append(span)
+        self.trace.tracer.emit(self.trace, span)
+
+
+class Trace:
+    """ Timings of every phase of loading a single record """
+
+    def __init__(self, tracer, key):
+        self.tracer = tracer
+        self.key = key
+        self.spans = []
+        self.start = time.monotonic()
+        self.requests = tracer.request_count()
+        self.duration = None
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def finish(self):
+        self.duration = time.monotonic() - self.start
+        self.requests = self.tracer.request_count() - self.requests
+        self.tracer.finish(self)
+
+    def dict(self):
+        return {
+            'key': self.key,
+            'duration': self.duration,
+            'requests': self.requests,
+            'spans': [s._asdict() for s in self.spans],
+        }
+
+
+class Tracer:
+    """ Collects per-record traces, keeping a sample of slow records
+
+    Records slower than ``threshold`` seconds are kept in a ring buffer of ``sample_size`` traces and, when ``path``
+    is set, appended to a JSONL log. Every finished span is passed to each of ``callbacks`` as
+    ``callback(trace, span)``. Request counts are read from the client transport, so they are only exact when records
+    are loaded one at a time.
+    """
+
+    def __init__(self, *, transport, threshold=1.0, sample_size=100, path=None, callbacks=()):
+        self.transport = transport
+        self.threshold = threshold
+        self.path = path
+        self.callbacks = [load_callback(c) for c in callbacks]
+        self.slow = collections.deque(maxlen=sample_size)
+
+    def request_count(self):
+        return sum(self.transport.requests.values())
+
+    def begin(self, key):
+        return Trace(self, key)
+
+    def emit(self, trace, span):
+        for callback in self.callbacks:
+            try:
+                callback(trace, span)
+            except Exception as e:
+                log.warning(f'Trace callback {callback} failed: {e}')
+
+    def finish(self, trace):
+        if trace.duration < self.threshold:
+            return
+
+        log.debug(f'Slow record {trace.key} took {trace.duration:.3f}s with {trace.requests} requests')
+        self.slow.append(trace)
+
+        if self.path:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(trace.dict(), default=str) + '\n')
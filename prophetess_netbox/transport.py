@@ -0,0 +1,69 @@
+"""HTTP transport used by aionetbox."""
+
+import logging
+import collections
+import collections.abc
+
+import aiohttp
+
+log = logging.getLogger('prophetess.plugins.netbox.transport')
+
+
+class Transport:
+    """ Session facade handed to aionetbox
+
+    aionetbox only calls ``request`` and ``close`` on its session, which lets the connection pool, keepalive,
+    DNS cache, timeouts and compression be tuned here. The underlying ``aiohttp.ClientSession`` is created
+    lazily so it is always bound to the running loop.
+    """
+
+    def __init__(self, *, limit=100, limit_per_host=0, keepalive_timeout=15, use_dns_cache=True, ttl_dns_cache=10,
+                 timeout=None, compress=None):
+        self.connector_options = {
+            'limit': limit,
+            'limit_per_host': limit_per_host,
+            'keepalive_timeout': keepalive_timeout,
+            'use_dns_cache': use_dns_cache,
+            'ttl_dns_cache': ttl_dns_cache,
+        }
+        self.timeout = self.build_timeout(timeout)
+        self.headers = {}
+        self.session = None
+        self.requests = collections.Counter()
+
+        if compress is not None:
+            self.headers['Accept-Encoding'] = 'gzip, deflate' if compress else 'identity'
+
+    @staticmethod
+    def build_timeout(timeout):
+        if timeout is None:
+            return None
+
+        if isinstance(timeout, collections.abc.Mapping):
+            return aiohttp.ClientTimeout(**timeout)
+
+        return aiohttp.ClientTimeout(total=timeout)
+
+    def build_session(self):
+        connector = aiohttp.TCPConnector(**self.connector_options)
+        options = {'connector': connector, 'headers': self.headers}
+
+        if self.timeout:
+            options['timeout'] = self.timeout
+
+        return aiohttp.ClientSession(**options)
+
+    async def request(self, **kwargs):
+        if self.session is None:
+            self.session = self.build_session()
+
+        # aionetbox always passes its own 5 minute timeout, a configured timeout takes precedence
+        if self.timeout:
+            kwargs['timeout'] = self.timeout
+
+        self.requests[kwargs.get('method')] += 1
+        return await self.session.request(**kwargs)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
@@ -0,0 +1,98 @@
+"""Keep lookup indexes current from Netbox webhooks."""
+
+import hmac
+import json
+import hashlib
+import logging
+
+from urllib.parse import urlparse
+
+from aiohttp import web
+
+from prophetess.exceptions import InvalidConfigurationException
+
+log = logging.getLogger('prophetess.plugins.netbox.webhook')
+
+
+class WebhookReceiver:
+    """ Small embedded HTTP endpoint accepting Netbox webhook payloads
+
+    Created and updated objects are re-indexed, deleted objects are evicted. Payloads are written into the lookup
+    indexes, so the ``X-Hook-Signature`` header (HMAC-SHA512 of the body) must match ``secret``. Running without a
+    secret requires ``insecure`` to be set.
+    """
+
+    def __init__(self, lookup, *, host='127.0.0.1', port=8089, path='/webhook', secret=None, insecure=False):
+        if not secret and not insecure:
+            raise InvalidConfigurationException('Webhook receiver requires a secret, or insecure: true')
+
+        self.lookup = lookup
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.runner = None
+        self.disabled = False
+
+    async def start(self):
+        if self.runner is not None or self.disabled:
+            return
+
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        try:
+            await web.TCPSite(self.runner, self.host, self.port).start()
+        except OSError as e:
+            log.error('Unable to listen for webhooks on {}:{}, disabling the receiver: {}'.format(
+                self.host, self.port, e))
+            await self.stop()
+            self.disabled = True
+            return
+
+        log.debug('Listening for Netbox webhooks on {}:{}{}'.format(self.host, self.port, self.path))
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def verify(self, body, signature):
+        if not self.secret:
+            return True
+
+        expected = hmac.new(self.secret.encode(), body, hashlib.sha512).hexdigest()
+        return hmac.compare_digest(expected, signature or '')
+
+    async def handle(self, request):
+        body = await request.read()
+
+        if not self.verify(body, request.headers.get('X-Hook-Signature')):
+            log.warning('Rejected webhook with an invalid signature')
+            return web.Response(status=403)
+
+        try:
+            self.apply(json.loads(body))
+        except (ValueError, KeyError, AttributeError) as e:
+            log.warning('Invalid webhook payload: {}'.format(e))
+            return web.Response(status=400)
+
+        return web.Response(status=204)
+
+    def apply(self, payload):
+        """ Update lookup indexes from a webhook payload """
+        data = payload['data']
+
+        # http://netbox/api/dcim/sites/1/ -> dcim, sites
+        parts = [p for p in urlparse(data['url']).path.split('/') if p]
+        endpoint, model = parts[parts.index('api') + 1:parts.index('api') + 3]
+
+        event = payload['event']
+        log.debug('Webhook {} for {}.{} {}'.format(event, endpoint, model, data['id']))
+
+        if event.endswith('deleted'):
+            self.lookup.forget(endpoint, model, data['id'])
+        else:
+            self.lookup.remember(endpoint, model, data, created=event.endswith('created'))
@@ -40,6 +40,7 @@ setup(
     python_requires='>=3.6',
     install_requires=[
         'aionetbox',
+        'aiohttp>=3.3,<4.0',
     ],
     classifiers=[
         'Environment :: Plugins',
@@ -0,0 +1,121 @@
+import gzip
+import json
+
+import pytest
+import asynctest
+
+from unittest.mock import MagicMock, patch
+
+from prophetess_netbox.client import NetboxClient
+from prophetess_netbox.cassette import RecordingTransport, ReplayTransport, redact, request_key
+from prophetess_netbox.exceptions import CassetteMiss
+
+spec = {
+    'basePath': '/api',
+    'paths': {
+        '/dcim/sites/': {
+            'get': {
+                'operationId': 'dcim_sites_list',
+                'tags': ['dcim'],
+                'parameters': [{'name': 'slug', 'in': 'query', 'required': False}],
+                'responses': {'200': {'schema': {'type': 'object', 'properties': {
+                    'count': {'type': 'integer'},
+                    'next': {'type': 'string'},
+                    'results': {'type': 'array', 'items': {'type': 'object', 'properties': {}}},
+                }}}},
+            },
+        },
+    },
+}
+
+
+def build_response(status, body):
+    resp = MagicMock(status=status)
+    resp.text = asynctest.CoroutineMock(return_value=json.dumps(body))
+    return resp
+
+
+def test_redact():
+    assert {'session_key': '<redacted>', 'results': [{'private_key': '<redacted>', 'id': 1}]} == redact(
+        {'session_key': 'abc', 'results': [{'private_key': 'def', 'id': 1}]}
+    )
+    assert {'results': [{'plaintext': '<redacted>', 'key': '<redacted>', 'id': 1}]} == redact(
+        {'results': [{'plaintext': 'hunter2', 'key': '0123abcd', 'id': 1}]}
+    )
+    assert {'serial': '<redacted>', 'id': 1} == redact({'serial': 'abc', 'id': 1}, keys=('serial',))
+
+
+def test_request_key():
+    assert request_key('get', 'http://a/api/dcim/sites/', {'slug': 'x', 'limit': 1}) == request_key(
+        'GET', 'http://b/api/dcim/sites/', {'limit': '1', 'slug': 'x'}
+    )
+    assert request_key('post', 'http://a/graphql/', data='{"b": 1, "a": 2}') == request_key(
+        'POST', 'http://a/graphql/', data='{"a": 2, "b": 1}'
+    )
+    assert request_key('get', 'http://a/api/dcim/sites/') != request_key('post', 'http://a/api/dcim/sites/')
+
+
+@pytest.mark.asyncio
+async def test_RecordingTransport_replay(tmp_path):
+    path = str(tmp_path / 'run.jsonl.gz')
+    session = MagicMock()
+    session.close = asynctest.CoroutineMock()
+    session.request = asynctest.CoroutineMock(side_effect=[
+        build_response(200, {'count': 1, 'results': [{'id': 1}]}),
+        build_response(200, {'count': 1, 'results': [{'id': 2, 'comments': 'rack key in drawer'}]}),
+        build_response(200, {'session_key': 'secret'}),
+    ])
+
+    transport = RecordingTransport(path, redact=['comments'])
+    transport.spec = spec
+
+    with patch.object(RecordingTransport, 'build_session', return_value=session):
+        for _ in range(2):
+            await transport.request(method='GET', url='http://a/api/dcim/sites/', params={'slug': 'x'},
+                                    headers={'Authorization': 'Token 12test'})
+        await transport.request(method='POST', url='http://a/api/secrets/get-session-key/', data=MagicMock())
+    await transport.close()
+
+    with gzip.open(path, 'rt') as f:
+        recorded = f.read()
+
+    assert '12test' not in recorded
+    assert '"secret"' not in recorded
+    assert 'drawer' not in recorded
+
+    replay = ReplayTransport(path)
+
+    assert spec == replay.spec
+
+    for obj_id in (1, 2, 2):
+        resp = await replay.request(method='GET', url='http://b/api/dcim/sites/', params={'slug': 'x'})
+        assert resp.ok
+        assert obj_id == (await resp.json())['results'][0]['id']
+
+    with pytest.raises(CassetteMiss):
+        await replay.request(method='GET', url='http://b/api/dcim/sites/', params={'slug': 'y'})
+
+    assert 4 == replay.requests['GET']
+
+
+@pytest.mark.asyncio
+async def test_NetboxClient_replay(tmp_path):
+    path = str(tmp_path / 'run.jsonl.gz')
+    with gzip.open(path, 'wt') as f:
+        f.write(json.dumps({'spec': spec}) + '\n')
+        f.write(json.dumps({
+            'key': request_key('GET', 'http://netbox/api/dcim/sites/', {'slug': 'x'}),
+            'status': 200,
+            'body': json.dumps({'count': 1, 'next': None, 'results': [{'id': 4, 'slug': 'x'}]}),
+        }) + '\n')
+
+    with patch('prophetess_netbox.client.AIONetbox.from_openapi') as mfo:
+        nb = NetboxClient(host='http://netbox', api_key='12test', transport={'replay': path})
+
+    mfo.assert_not_called()
+
+    site = await nb.entity(endpoint='dcim', model='sites', params={'slug': 'x'})
+
+    assert 4 == site.id
+
+    await nb.close()
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+
+from prophetess_netbox.checkpoint import Checkpoint
+
+
+def test_Checkpoint(tmp_path):
+    cp = Checkpoint(path=str(tmp_path), run_id='run-1', fsync_every=2)
+
+    assert not cp.resume({'slug': 'a'})
+
+    cp.mark({'slug': 'a'}, 'written', 1)
+
+    assert not cp.resume({'slug': 'a'})
+    assert 1 == cp.unsynced
+
+    cp.mark({'slug': 'b'}, 'unchanged')
+
+    assert 0 == cp.unsynced
+
+    cp.close()
+
+    lines = [json.loads(line) for line in (tmp_path / 'run-1.jsonl').read_text().splitlines()]
+    assert [
+        {'pk': {'slug': 'a'}, 'result': 'written', 'id': 1},
+        {'pk': {'slug': 'b'}, 'result': 'unchanged', 'id': None},
+    ] == lines
+
+
+def test_Checkpoint_resume(tmp_path):
+    (tmp_path / 'run-1.jsonl').write_text(
+        '{"pk": {"slug": "a", "id": 1}, "result": "written", "id": 4}\n'
+        '{"pk": {"slug": "b"'
+    )
+
+    cp = Checkpoint(path=str(tmp_path), run_id='run-1')
+
+    assert not cp.resume({'slug': 'b'})
+    assert not Checkpoint(path=str(tmp_path), run_id='run-2').resume({'slug': 'a', 'id': 1})
+    assert cp.resume({'id': '1', 'slug': 'a'})
+    assert not cp.resume({'id': '1', 'slug': 'a'})
+
+
+def test_Checkpoint_duplicates(tmp_path):
+    cp = Checkpoint(path=str(tmp_path), run_id='run-1')
+
+    for slug in ('a', 'b', 'c', 'd', 'b'):
+        cp.mark({'slug': slug}, 'written')
+    cp.close()
+
+    lines = [json.loads(line)['pk']['slug'] for line in (tmp_path / 'run-1.jsonl').read_text().splitlines()]
+    assert ['a', 'b', 'c', 'd', 'b'] == lines
+
+    cp = Checkpoint(path=str(tmp_path), run_id='run-1')
+
+    assert cp.resume({'slug': 'b'})
+    assert cp.resume({'slug': 'b'})
+    assert not cp.resume({'slug': 'b'})
+    assert cp.resume({'slug': 'a'})
+
+
+def test_Checkpoint_rotate(tmp_path):
+    (tmp_path / 'run-1.jsonl').write_text('{"pk": {"slug": "z"}, "result": "written", "id": 9}\n')
+    cp = Checkpoint(path=str(tmp_path), run_id='run-1', idle=60)
+
+    cp.mark({'slug': 'a'}, 'written', 1)
+    cp.mark({'slug': 'b'}, 'written', 2)
+
+    # Nothing completed for longer than idle, the next record starts a new pass
+    cp.last -= 61
+    cp.mark({'slug': 'a'}, 'unchanged', 1)
+    cp.close()
+
+    lines = [json.loads(line) for line in (tmp_path / 'run-1.jsonl').read_text().splitlines()]
+    assert [{'pk': {'slug': 'a'}, 'result': 'unchanged', 'id': 1}] == lines
+    assert not cp.resume({'slug': 'z'})
+
+
+def test_Checkpoint_finished(tmp_path):
+    path = tmp_path / 'run-1.jsonl'
+    path.write_text('{"pk": {"slug": "z"}, "result": "written", "id": 9}\n')
+    os.utime(str(path), (time.time() - 120, time.time() - 120))
+
+    cp = Checkpoint(path=str(tmp_path), run_id='run-1', idle=60)
+
+    assert not cp.resume({'slug': 'z'})
+
+    cp.mark({'slug': 'a'}, 'written', 1)
+    cp.close()
+
+    assert ['a'] == [json.loads(line)['pk']['slug'] for line in path.read_text().splitlines()]
+
+
+def test_Checkpoint_close_unused(tmp_path):
+    cp = Checkpoint(path=str(tmp_path / 'missing'), run_id='run-1')
+    cp.close()
+
+    assert not (tmp_path / 'missing').exists()
@@ -2,20 +2,26 @@
 import pytest
 import asynctest
 
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from prophetess_netbox.client import NetboxClient
-from prophetess_netbox.exceptions import InvalidPKConfig, InvalidNetboxEndpoint, InvalidNetboxOperation
+from prophetess_netbox.exceptions import (
+    GraphQLQueryFailed,
+    InvalidPKConfig,
+    InvalidNetboxEndpoint,
+    InvalidNetboxOperation,
+)
 from .fixtures import AIONetboxMock, AIONetboxMagicMock, AIONetboxResponseMock
 
 
 @patch('prophetess_netbox.client.AIONetbox')
 def test_NetboxClient(maionb):
-    NetboxClient(host='http://test', api_key='key')
+    nb = NetboxClient(host='http://test', api_key='key')
 
     maionb.from_openapi.assert_called_with(
         url='http://test',
-        api_key='key'
+        api_key='key',
+        session=nb.transport,
     )
 
 
@@ -38,6 +44,16 @@ def test_NetboxClient_build_model(maionb):
     assert model == client.api.api_test_get
 
 
+@patch('prophetess_netbox.client.AIONetbox', new_callable=AIONetboxMagicMock)
+def test_NetboxClient_build_model_memoized(maionb):
+    nb = NetboxClient(host='http://test', api_key='key')
+
+    with patch.object(NetboxClient, '_resolve') as mr:
+        assert nb.build_model('dcim', 'sites', 'list') is nb.build_model('dcim', 'sites', 'list')
+
+    mr.assert_called_once_with('dcim', 'sites', 'list')
+
+
 @patch('prophetess_netbox.client.AIONetbox', new_callable=AIONetboxMagicMock)
 def test_NetboxClient_build_model_invalid_endpoint(maionb):
     maionb.from_openapi = AIONetboxMock
@@ -202,3 +218,218 @@ async def test_NetboxClient_entities_empty(__aionb):
         )
 
         assert entity is None
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_fetch_hedged(__aionb):
+
+    with patch.object(NetboxClient, 'build_model') as mbm:
+        mbm.return_value = asynctest.CoroutineMock(return_value='results')
+
+        nb = NetboxClient(host='http://test', api_key='key', hedge={'min_samples': 1})
+        ret = await nb.fetch(endpoint='test', model='testing', params={'foo': 'bar'})
+
+        assert 'results' == ret
+        assert 1 == nb.hedge.requests
+        mbm.return_value.assert_called_with(foo='bar')
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_graphql(maionb):
+    nb = NetboxClient(host='http://test', api_key='key')
+    nb.client.host = 'http://test'
+    nb.client.request = asynctest.CoroutineMock()
+    nb.client.request.return_value.ok = True
+    nb.client.request.return_value.json = asynctest.CoroutineMock(return_value={'data': {'pk': []}})
+
+    assert {'pk': []} == await nb.graphql('query { pk: site_list { id } }')
+
+    nb.client.request.assert_called_with(
+        method='post',
+        url='http://test/graphql/',
+        body={'query': 'query { pk: site_list { id } }'},
+    )
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_graphql_errors(maionb):
+    nb = NetboxClient(host='http://test', api_key='key')
+    nb.client.request = asynctest.CoroutineMock()
+    nb.client.request.return_value.ok = True
+    nb.client.request.return_value.json = asynctest.CoroutineMock(return_value={'errors': [{'message': 'bad'}]})
+
+    with pytest.raises(GraphQLQueryFailed):
+        await nb.graphql('query { nope }')
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_count(maionb):
+    nb = NetboxClient(host='http://test', api_key='key')
+    nb.client.host = 'http://test'
+    nb.client.config = {'_orig': {'basePath': '/api'}}
+    nb.client.request = asynctest.CoroutineMock()
+    nb.client.request.return_value.ok = True
+    nb.client.request.return_value.json = asynctest.CoroutineMock(return_value={'count': 12, 'results': []})
+
+    assert 12 == await nb.count(endpoint='dcim', model='ip-addresses', params={'vrf': 'a'})
+
+    nb.client.request.assert_called_with(
+        method='get',
+        url='http://test/api/dcim/ip-addresses/',
+        query_params={'vrf': 'a', 'limit': 1, 'brief': 1},
+    )
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_entity_indexed(__aionb):
+    nb = NetboxClient(host='http://test', api_key='key', lookup={'strategy': 'prefetch'})
+    nb.marker = asynctest.CoroutineMock()
+    nb.pages = MagicMock()
+    nb.pages.return_value.__aiter__.return_value = [[{'id': 1, 'slug': 'test'}]]
+
+    with patch.object(NetboxClient, 'read', new_callable=asynctest.CoroutineMock) as mr:
+        assert 1 == (await nb.entity(endpoint='test', model='testing', params={'slug': 'test'})).id
+        assert await nb.entity(endpoint='test', model='testing', params={'slug': 'nope'}) is None
+
+        full = await nb.entity(endpoint='test', model='testing', params={'slug': 'test'}, full=True)
+
+        assert mr.return_value == full
+        mr.assert_called_once_with(endpoint='test', model='testing', id=1)
+        nb.pages.assert_called_once()
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_entity_ambiguous(__aionb):
+    nb = NetboxClient(host='http://test', api_key='key', lookup={'strategy': 'prefetch'})
+    nb.marker = asynctest.CoroutineMock()
+    nb.pages = MagicMock()
+    nb.pages.return_value.__aiter__.return_value = [[{'id': 1, 'name': 'sw1'}, {'id': 2, 'name': 'sw1'}]]
+
+    with patch.object(NetboxClient, 'fetch', new_callable=asynctest.CoroutineMock) as mf:
+        mf.return_value = AIONetboxResponseMock(count=2)
+
+        with pytest.raises(InvalidPKConfig):
+            await nb.entity(endpoint='dcim', model='devices', params={'name': 'sw1'})
+
+        mf.assert_called_once_with(endpoint='dcim', model='devices', params={'name': 'sw1'})
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_pages(maionb):
+    nb = NetboxClient(host='http://test', api_key='key')
+    nb.client.host = 'http://test'
+    nb.client.config = {'_orig': {'basePath': '/api'}}
+    nb.client.request = asynctest.CoroutineMock()
+    nb.client.request.return_value.ok = True
+    nb.client.request.return_value.json = asynctest.CoroutineMock(side_effect=[
+        {'next': 'http://test/api/dcim/sites/?limit=1&offset=1', 'results': [{'id': 1}]},
+        {'next': None, 'results': [{'id': 2}]},
+    ])
+
+    pages = [page async for page in nb.pages(endpoint='dcim', model='sites', params={'limit': 1})]
+
+    assert [[{'id': 1}], [{'id': 2}]] == pages
+    nb.client.request.assert_called_with(
+        method='get',
+        url='http://test/api/dcim/sites/',
+        query_params={'limit': '1', 'offset': '1'},
+    )
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_marker(maionb):
+    nb = NetboxClient(host='http://test', api_key='key')
+
+    with patch.object(NetboxClient, 'page', new_callable=asynctest.CoroutineMock) as mp:
+        mp.side_effect = [
+            {'count': 10, 'results': [{'id': 3, 'last_updated': '2020-01-01T00:00:00Z'}]},
+            {'count': 10, 'results': [{'id': 12}]},
+        ]
+
+        marker = await nb.marker(endpoint='dcim', model='sites')
+
+    assert {'count': 10, 'max_id': 12, 'last_updated': '2020-01-01T00:00:00Z'} == marker
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_entity_cached(__aionb):
+
+    with patch.object(NetboxClient, 'fetch', new_callable=asynctest.CoroutineMock) as mf:
+        mf.return_value = AIONetboxResponseMock()
+        mf.return_value.count = 1
+        mf.return_value.results = [AIONetboxResponseMock(id=4)]
+
+        nb = NetboxClient(host='http://test', api_key='key', lookup={'cache': True})
+        nb.marker = asynctest.CoroutineMock()
+
+        assert 4 == (await nb.entity(endpoint='test', model='testing', params={'slug': 'test'})).id
+        assert 4 == (await nb.entity(endpoint='test', model='testing', params={'slug': 'test'})).id
+
+        mf.assert_called_once()
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_prepare(maionb):
+    nb = NetboxClient(host='http://test', api_key='key')
+    nb.count = asynctest.CoroutineMock(return_value=3)
+    nb.lookup.preload = asynctest.CoroutineMock()
+
+    with patch.object(NetboxClient, 'build_model') as mbm:
+        await nb.prepare([
+            ('dcim', 'devices', ['create', 'list'], ()),
+            ('dcim', 'sites', ['list'], ('slug',)),
+        ], prefetch=100)
+
+    assert 3 == mbm.call_count
+    nb.count.assert_called_once_with(endpoint='dcim', model='devices')
+    nb.lookup.preload.assert_called_once_with('dcim', 'sites', ('slug',), max_count=100)
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_prepare_invalid(maionb):
+    nb = NetboxClient(host='http://test', api_key='key')
+    nb.count = asynctest.CoroutineMock()
+
+    with patch.object(NetboxClient, 'build_model', side_effect=InvalidNetboxOperation('nope')):
+        with pytest.raises(InvalidNetboxOperation):
+            await nb.prepare([('dcim', 'sites', ['list'], ())])
+
+    nb.count.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_objects(maionb):
+    nb = NetboxClient(host='http://test', api_key='key')
+    nb.page = asynctest.CoroutineMock(return_value={'next': None, 'results': [{'id': 1}, {'id': 7}]})
+
+    assert {1: {'id': 1}, 7: {'id': 7}} == await nb.objects(endpoint='dcim', model='sites', ids=[1, 7])
+
+    nb.page.assert_called_once_with(endpoint='dcim', model='sites', params={'id__in': '1,7', 'limit': 2})
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.client.AIONetbox')
+async def test_NetboxClient_entity_stats(maionb):
+    nb = NetboxClient(host='http://test', api_key='key')
+    nb.lookup.index = asynctest.CoroutineMock(side_effect=[MagicMock(get=MagicMock(return_value=4)), None])
+
+    with patch.object(NetboxClient, 'fetch', new_callable=asynctest.CoroutineMock) as mf:
+        mf.return_value.count = 0
+        await nb.entity(endpoint='dcim', model='sites', params={'slug': 'a'})
+        await nb.entity(endpoint='dcim', model='sites', params={'slug': 'b'})
+
+    assert 2 == nb.stats[('dcim', 'sites')]['lookups']
+    assert 1 == nb.stats[('dcim', 'sites')]['hits']
+    assert nb.stats[('dcim', 'sites')]['time'] >= 0
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+import asynctest
+
+from prophetess_netbox.coalesce import Coalescer, Periodic
+from prophetess_netbox.exceptions import NetboxOperationFailed
+
+
+@pytest.mark.asyncio
+async def test_Coalescer_merge():
+    flush = asynctest.CoroutineMock()
+    c = Coalescer(flush, window=60)
+
+    await c.add({'slug': 'a', 'name': 'first', 'site': 1}, {'slug': 'a'})
+    await c.add({'slug': 'b', 'name': 'other'}, {'slug': 'b'})
+    await c.add({'slug': 'a', 'name': 'second'}, {'slug': 'a'})
+
+    flush.assert_not_called()
+    assert 1 == c.merged
+
+    await c.close()
+
+    assert [
+        (({'slug': 'a', 'name': 'second', 'site': 1}, {'slug': 'a'}),),
+        (({'slug': 'b', 'name': 'other'}, {'slug': 'b'}),),
+    ] == [(call.args,) for call in flush.call_args_list]
+    assert c.timer.task is None
+
+
+@pytest.mark.asyncio
+async def test_Coalescer_window():
+    flush = asynctest.CoroutineMock()
+    c = Coalescer(flush, window=0.02)
+
+    await c.add({'slug': 'a'}, {'slug': 'a'})
+    await asyncio.sleep(0.05)
+
+    flush.assert_called_once_with({'slug': 'a'}, {'slug': 'a'})
+    await c.close()
+
+
+@pytest.mark.asyncio
+async def test_Coalescer_max_pending():
+    flush = asynctest.CoroutineMock()
+    c = Coalescer(flush, window=60, max_pending=1)
+
+    await c.add({'slug': 'a'}, {'slug': 'a'})
+    await c.add({'slug': 'b'}, {'slug': 'b'})
+
+    flush.assert_called_once_with({'slug': 'a'}, {'slug': 'a'})
+    await c.close()
+
+
+@pytest.mark.asyncio
+async def test_Coalescer_failed():
+    flush = asynctest.CoroutineMock(side_effect=[NetboxOperationFailed('nope'), ValueError, None])
+    c = Coalescer(flush, window=60)
+
+    for slug in ('a', 'b', 'c'):
+        await c.add({'slug': slug}, {'slug': slug})
+
+    await c.close()
+
+    assert 3 == flush.call_count
+    assert not c.pending
+
+
+def test_Coalescer_key():
+    assert Coalescer.key({'slug': 'a', 'id': 1}) == Coalescer.key({'id': '1', 'slug': 'a'})
+
+
+@pytest.mark.asyncio
+async def test_Periodic(caplog):
+    flush = asynctest.CoroutineMock(side_effect=[NetboxOperationFailed('nope')] + [None] * 100)
+    p = Periodic(flush, 0.01)
+
+    p.start()
+    while flush.call_count < 2:
+        await asyncio.sleep(0.01)
+    p.stop()
+
+    # A failed flush is logged and doesn't stop the next one
+    assert p.task is None
+    assert 'Periodic flush failed' in caplog.text
+
+    await p.run(1)
+    flush.assert_called_with(1)
@@ -0,0 +1,46 @@
+from prophetess_netbox.diff import BatchDiff
+from prophetess_netbox.schema import FieldPlan
+
+
+existing = {
+    1: {'id': 1, 'name': 'a', 'status': {'value': 'active', 'label': 'Active'}, 'region': {'id': 3, 'name': 'r'}},
+    2: {'id': 2, 'name': 'b', 'status': {'value': 'planned', 'label': 'Planned'}, 'region': None},
+    3: {'id': 3, 'name': 'c', 'status': {'value': 'active', 'label': 'Active'}, 'region': {'id': 4, 'name': 's'}},
+}
+
+
+def test_BatchDiff():
+    records = [
+        (1, {'name': 'a', 'status': 'active', 'region': 3}),
+        (2, {'name': 'b', 'status': 'active', 'region': 3}),
+        (3, {'name': 'c', 'status': 'active', 'region': 4}),
+    ]
+
+    assert [(2, {'status': 'active', 'region': 3})] == BatchDiff().diff(existing, records)
+
+
+def test_BatchDiff_unknown_types():
+    records = [
+        (1, {'name': 5}),
+        (2, {'name': None, 'asn': 10}),
+    ]
+
+    assert [(2, {'name': None, 'asn': 10})] == BatchDiff().diff(existing, records)
+
+
+def test_BatchDiff_casts():
+    rows = {1: {'id': 1, 'latitude': '1.50'}, 2: {'id': 2, 'latitude': '2.0'}}
+
+    changes = BatchDiff(casts={'latitude': float}).diff(rows, [(1, {'latitude': 1.5}), (2, {'latitude': 3.0})])
+
+    assert [(2, {'latitude': 3.0})] == changes
+
+
+def test_BatchDiff_plan():
+    plan = FieldPlan({'name', 'status', 'region'}, {'status': 'value', 'region': 'id'}, {})
+    records = [
+        (1, {'name': 5, 'status': 'active', 'region': 3}),
+        (3, {'name': 'c', 'status': 'active', 'region': 4}),
+    ]
+
+    assert [(1, {'name': 5})] == BatchDiff(plan).diff(existing, records)
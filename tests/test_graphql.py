@@ -0,0 +1,84 @@
+import pytest
+import asynctest
+
+from unittest.mock import MagicMock
+
+from prophetess_netbox.graphql import GraphQLLookup, literal, alias
+from prophetess_netbox.exceptions import InvalidPKConfig
+
+
+def test_literal():
+    assert '"slug"' == literal('slug')
+    assert '"say \\"hi\\""' == literal('say "hi"')
+    assert '12' == literal(12)
+    assert 'true' == literal(True)
+
+
+def test_alias():
+    assert 'fk_device_role' == alias('fk_device-role')
+
+
+def test_GraphQLLookup_field():
+    gl = GraphQLLookup(MagicMock(), names={'vcs': 'virtual_chassis'})
+
+    assert 'site_list' == gl.field('sites')
+    assert 'ip_address_list' == gl.field('ip-addresses')
+    assert 'prefix_list' == gl.field('prefixes')
+    assert 'device_role_list' == gl.field('device-roles')
+    assert 'virtual_chassis_list' == gl.field('vcs')
+
+
+def test_GraphQLLookup_supported():
+    assert GraphQLLookup.supported({'slug': 'test'})
+    assert not GraphQLLookup.supported({'slug': 'test', 'cf_id': '1'})
+    assert not GraphQLLookup.supported({'slug': None})
+    assert not GraphQLLookup.supported({})
+
+
+def test_GraphQLLookup_compile():
+    gl = GraphQLLookup(MagicMock())
+
+    query = gl.compile({
+        'pk': ('sites', {'slug': 'nb-slug'}),
+        'fk_region': ('regions', {'slug': 'east', 'id': 4}),
+    })
+
+    assert query == (
+        'query {\n'
+        '  pk: site_list(slug: "nb-slug") { id }\n'
+        '  fk_region: region_list(slug: "east", id: 4) { id }\n'
+        '}'
+    )
+
+
+@pytest.mark.asyncio
+async def test_GraphQLLookup_resolve():
+    client = MagicMock()
+    client.graphql = asynctest.CoroutineMock(return_value={'pk': [{'id': '12'}], 'fk_region': []})
+    gl = GraphQLLookup(client)
+
+    ids = await gl.resolve({
+        'pk': ('sites', {'slug': 'nb-slug'}),
+        'fk_region': ('regions', {'slug': 'east'}),
+    })
+
+    assert {'pk': 12, 'fk_region': None} == ids
+    client.graphql.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_GraphQLLookup_resolve_empty():
+    client = MagicMock()
+    gl = GraphQLLookup(client)
+
+    assert {} == await gl.resolve({})
+
+
+@pytest.mark.asyncio
+async def test_GraphQLLookup_resolve_too_many():
+    client = MagicMock()
+    client.graphql = asynctest.CoroutineMock(return_value={'pk': [{'id': '1'}, {'id': '2'}]})
+    gl = GraphQLLookup(client)
+
+    with pytest.raises(InvalidPKConfig):
+        await gl.resolve({'pk': ('sites', {'name': 'dupe'})})
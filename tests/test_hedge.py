@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+import asynctest
+
+from prophetess_netbox.hedge import HedgePolicy
+
+
+def test_HedgePolicy_delay():
+    hp = HedgePolicy(percentile=50, min_delay=0.01, min_samples=4)
+
+    assert hp.delay() is None
+
+    hp.samples.extend([0.1, 0.2, 0.3, 0.4])
+
+    assert 0.3 == hp.delay()
+
+
+def test_HedgePolicy_delay_min():
+    hp = HedgePolicy(min_delay=0.5, min_samples=1)
+    hp.samples.append(0.01)
+
+    assert 0.5 == hp.delay()
+
+
+def test_HedgePolicy_allow():
+    hp = HedgePolicy(max_rate=0.5)
+    hp.requests = 2
+
+    assert hp.allow()
+
+    hp.hedged = 1
+
+    assert not hp.allow()
+
+
+@pytest.mark.asyncio
+async def test_HedgePolicy_run():
+    hp = HedgePolicy(min_samples=100)
+    func = asynctest.CoroutineMock(return_value='test')
+
+    assert 'test' == await hp.run(func, foo='bar')
+
+    func.assert_called_once_with(foo='bar')
+    assert 0 == hp.hedged
+    assert 1 == len(hp.samples)
+
+
+@pytest.mark.asyncio
+async def test_HedgePolicy_run_hedged():
+    hp = HedgePolicy(min_delay=0.01, max_rate=1, min_samples=1)
+    hp.samples.append(0.01)
+    delays = [1, 0]
+
+    async def lookup(**params):
+        await asyncio.sleep(delays.pop(0))
+        return len(delays)
+
+    assert 0 == await hp.run(lookup)
+    assert 1 == hp.hedged
+
+
+@pytest.mark.asyncio
+async def test_HedgePolicy_run_capped():
+    hp = HedgePolicy(min_delay=0.01, max_rate=0, min_samples=1)
+    hp.samples.append(0.01)
+    func = asynctest.CoroutineMock(side_effect=lambda: asyncio.sleep(0.05, result='slow'))
+
+    assert 'slow' == await hp.run(func)
+    assert 0 == hp.hedged
+    func.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_HedgePolicy_run_failed():
+    hp = HedgePolicy(min_samples=100)
+    func = asynctest.CoroutineMock(side_effect=ValueError)
+
+    with pytest.raises(ValueError):
+        await hp.run(func)
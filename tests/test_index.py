@@ -0,0 +1,165 @@
+from aionetbox.api import NetboxResponseObject
+
+from prophetess_netbox.index import BloomFilter, ModelIndex, ambiguous, extract, index_key, indexable
+
+
+def build_object(**data):
+    return NetboxResponseObject.from_response(data=data, type='object', properties={
+        'site': {'type': 'object'},
+        'status': {'type': 'object'},
+    })
+
+
+def test_extract():
+    obj = build_object(
+        id=4,
+        name='dev-1',
+        site={'id': 2, 'slug': 'site-a', 'name': 'Site A'},
+        status={'value': 'active', 'label': 'Active'},
+        custom_fields={'sf_id': 'abc'},
+    )
+
+    assert 'dev-1' == extract(obj, 'name')
+    assert 'site-a' == extract(obj, 'site')
+    assert 2 == extract(obj, 'site_id')
+    assert 'active' == extract(obj, 'status')
+    assert 'abc' == extract(obj, 'cf_sf_id')
+    assert extract(obj, 'cf_missing') is None
+    assert extract(obj, 'missing') is None
+
+
+def test_index_key():
+    assert index_key(('id', 'slug'), {'slug': 'a', 'id': 1}) == index_key(('id', 'slug'), {'slug': 'a', 'id': '1'})
+    assert index_key(('slug',), {'slug': 'a'}) != index_key(('slug',), {'slug': 'b'})
+
+
+def test_BloomFilter():
+    bf = BloomFilter(100)
+    keys = [index_key(('slug',), {'slug': i}) for i in range(100)]
+
+    for h in keys:
+        bf.add(h)
+
+    assert all(h in bf for h in keys)
+    assert sum(index_key(('slug',), {'slug': -i}) in bf for i in range(1, 1001)) < 50
+
+
+def test_ModelIndex():
+    idx = ModelIndex('dcim', 'sites', ('slug',))
+    site = build_object(id=1, slug='a')
+
+    idx.add(site, created=True)
+
+    assert 1 == len(idx)
+    assert 1 == idx.get({'slug': 'a'})
+    assert idx.get({'slug': 'b'}) is None
+
+
+def test_ModelIndex_freeze():
+    idx = ModelIndex('dcim', 'sites', ('slug',), bloom=True)
+
+    idx.extend((idx.key({'slug': str(i)}), i) for i in range(1, 100))
+    idx.freeze()
+    idx.add({'id': 100, 'slug': '100'}, created=True)
+
+    assert 100 == len(idx)
+    assert list(idx.hashes) == sorted(idx.hashes)
+    assert all(i == idx.get({'slug': str(i)}) for i in range(1, 101))
+    assert idx.get({'slug': 'nope'}) is None
+
+
+def test_ModelIndex_ambiguous():
+    idx = ModelIndex('dcim', 'devices', ('name',))
+
+    idx.extend([(idx.key({'name': 'sw1'}), 1), (idx.key({'name': 'sw2'}), 3), (idx.key({'name': 'sw1'}), 2)])
+    idx.freeze()
+
+    assert ambiguous == idx.get({'name': 'sw1'})
+    assert 3 == idx.get({'name': 'sw2'})
+
+    # Updating one of them doesn't make the key unique again, a new object sharing a key makes it ambiguous
+    idx.add({'id': 1, 'name': 'sw1'})
+    idx.add({'id': 4, 'name': 'sw2'}, created=True)
+
+    assert ambiguous == idx.get({'name': 'sw1'})
+    assert ambiguous == idx.get({'name': 'sw2'})
+
+    # Netbox resolving a key to a single object is trusted
+    idx.resolve({'name': 'sw2'}, 4)
+    idx.freeze()
+
+    assert ambiguous == idx.get({'name': 'sw1'})
+    assert 4 == idx.get({'name': 'sw2'})
+
+
+def test_ModelIndex_merge():
+    idx = ModelIndex('dcim', 'sites', ('slug',))
+    idx.merge_threshold = 2
+
+    for i in range(1, 5):
+        idx.add({'id': i, 'slug': str(i)}, created=True)
+
+    assert 1 == len(idx.recent)
+    assert 3 == len(idx.ids)
+    assert all(i == idx.get({'slug': str(i)}) for i in range(1, 5))
+
+
+def test_ModelIndex_update():
+    idx = ModelIndex('dcim', 'sites', ('slug',))
+
+    idx.add(build_object(id=1, slug='a'))
+    idx.freeze()
+    idx.add(build_object(id=1, slug='b'))
+
+    assert 1 == len(idx)
+    assert idx.get({'slug': 'a'}) is None
+    assert 1 == idx.get({'slug': 'b'})
+
+
+def test_ModelIndex_remove():
+    idx = ModelIndex('dcim', 'sites', ('slug',))
+
+    idx.add({'id': 1, 'slug': 'a'})
+    idx.add({'id': 2, 'slug': 'b'})
+    idx.freeze()
+    idx.remove(1)
+    idx.remove(2)
+    idx.remove(3)
+
+    assert 0 == len(idx)
+    assert idx.get({'slug': 'a'}) is None
+
+    idx.add({'id': 1, 'slug': 'a'})
+
+    assert 1 == idx.get({'slug': 'a'})
+
+    idx.freeze()
+
+    assert [1] == list(idx.ids)
+    assert not idx.removed
+
+
+def test_ModelIndex_freeze_chunks():
+    idx = ModelIndex('dcim', 'sites', ('slug',))
+    idx.chunk_size = 7
+
+    idx.extend((idx.key({'slug': str(i)}), i) for i in range(1, 51))
+    idx.remove(10)
+    idx.add({'id': 51, 'slug': '51'}, created=True)
+    idx.freeze()
+
+    assert 50 == len(idx)
+    assert list(idx.hashes) == sorted(idx.hashes)
+    assert idx.get({'slug': '10'}) is None
+    assert all(i == idx.get({'slug': str(i)}) for i in range(1, 52) if i != 10)
+
+
+def test_indexable():
+    assert indexable('slug')
+    assert indexable('site_id')
+    assert not indexable('cf_asset')
+    assert indexable('cf_asset', extra=('cf_asset',))
+    assert not indexable('name__ie')
+    assert not indexable('address')
+    assert not indexable('region_id')
+    assert not indexable('q')
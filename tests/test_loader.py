@@ -1,14 +1,18 @@
 
+import json
+import asyncio
+import collections
+
 import pytest
 import asynctest
 
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from aionetbox.api import NetboxResponseObject
 from aionetbox.exceptions import AIONetboxException
 
 from prophetess_netbox.loader import NetboxLoader
-from prophetess_netbox.exceptions import NetboxOperationFailed
+from prophetess_netbox.exceptions import InvalidNetboxOperation, NetboxOperationFailed
 from .fixtures import AIONetboxMagicMock, AIONetboxResponseMock
 
 
@@ -352,6 +356,7 @@ async def test_NetboxLoader_run_create(mnbc):
 
     mnbc.return_value.build_model.assert_called_with('dcim', 'sites', 'create')
     mnbc.return_value.build_model.return_value.assert_called_with(data=record)
+    mnbc.return_value.remember.assert_called_with('dcim', 'sites', ret, created=True)
 
 
 @pytest.mark.asyncio
@@ -460,3 +465,539 @@ async def test_NetboxLoader_close(mnbc):
     await nbl.close()
 
     mnbc.return_value.close.assert_called()
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_traced(mnbc):
+
+    config = {
+        'host': 'http://testing',
+        'api_key': '12test',
+        'endpoint': 'dcim',
+        'model': 'sites',
+        'pk': ['slug'],
+        'trace': {
+            'threshold': 0,
+        },
+    }
+
+    record = {
+        'slug': 'goodbye',
+    }
+
+    mnbc.return_value.transport.requests = {}
+    nbl = NetboxLoader(id='nbloader', config=config)
+    mnbc.return_value.entity = asynctest.CoroutineMock(return_value=None)
+    mnbc.return_value.build_model.return_value = asynctest.CoroutineMock()
+
+    await nbl.run(record)
+
+    trace = nbl.tracer.slow.pop()
+    assert {'slug': 'goodbye'} == trace.key
+    assert ['pk', 'write'] == [s.name for s in trace.spans]
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.GraphQLLookup.resolve', new_callable=asynctest.CoroutineMock)
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_graphql(mnbc, mresolve):
+
+    config = {
+        'host': 'http://testing',
+        'api_key': '12test',
+        'endpoint': 'dcim',
+        'model': 'sites',
+        'graphql': True,
+        'pk': ['slug'],
+        'fk': {
+            'region': {
+                'endpoint': 'dcim',
+                'model': 'regions',
+                'pk': ['region'],
+            },
+            'tenant': {
+                'endpoint': 'tenancy',
+                'model': 'tenants',
+                'pk': [{'cf_id': '{tenant}'}],
+            },
+        },
+    }
+
+    record = {
+        'slug': 'hello',
+        'region': 'east',
+        'tenant': 'ten-1',
+    }
+
+    nbl = NetboxLoader(id='nbloader', config=config)
+    mresolve.return_value = {'pk': 42, 'fk_region': 7}
+    mnbc.return_value.entity = asynctest.CoroutineMock()
+    mnbc.return_value.entity.return_value.id = 3
+    mnbc.return_value.build_model.return_value = asynctest.CoroutineMock()
+
+    await nbl.run(record)
+
+    mresolve.assert_called_once_with({
+        'pk': ('sites', {'slug': 'hello'}),
+        'fk_region': ('regions', {'region': 'east'}),
+    })
+    mnbc.return_value.entity.assert_called_once_with(endpoint='tenancy', model='tenants', params={'cf_id': 'ten-1'})
+    mnbc.return_value.build_model.assert_called_with('dcim', 'sites', 'update')
+    mnbc.return_value.build_model.return_value.assert_called_with(
+        id=42,
+        data={'slug': 'hello', 'region': 7, 'tenant': 3},
+    )
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.GraphQLLookup.resolve', new_callable=asynctest.CoroutineMock)
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_graphql_partial(mnbc, mresolve):
+
+    config = {
+        'host': 'http://testing',
+        'api_key': '12test',
+        'endpoint': 'dcim',
+        'model': 'sites',
+        'update_method': 'partial_update',
+        'graphql': True,
+        'pk': ['slug'],
+    }
+
+    nbl = NetboxLoader(id='nbloader', config=config)
+    mresolve.return_value = {}
+    mnbc.return_value.entity = asynctest.CoroutineMock(return_value=None)
+    mnbc.return_value.build_model.return_value = asynctest.CoroutineMock()
+
+    await nbl.run({'slug': 'hello'})
+
+    mresolve.assert_called_once_with({})
+    mnbc.return_value.entity.assert_called_once_with(
+        endpoint='dcim',
+        model='sites',
+        params={'slug': 'hello'},
+        full=True,
+    )
+    mnbc.return_value.build_model.assert_called_with('dcim', 'sites', 'create')
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_coalesced(mnbc):
+
+    config = {
+        'host': 'http://testing',
+        'api_key': '12test',
+        'endpoint': 'dcim',
+        'model': 'sites',
+        'pk': ['slug'],
+        'coalesce': {
+            'window': 60,
+        },
+    }
+
+    mnbc.return_value.close = asynctest.CoroutineMock()
+    nbl = NetboxLoader(id='nbloader', config=config)
+    mnbc.return_value.entity = asynctest.CoroutineMock(return_value=None)
+    mnbc.return_value.build_model.return_value = asynctest.CoroutineMock()
+
+    assert await nbl.run({'slug': 'a', 'name': 'first'}) is None
+    assert await nbl.run({'slug': 'a', 'name': 'second'}) is None
+
+    mnbc.return_value.entity.assert_not_called()
+
+    await nbl.close()
+
+    mnbc.return_value.entity.assert_called_once()
+    mnbc.return_value.build_model.return_value.assert_called_once_with(data={'slug': 'a', 'name': 'second'})
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_schema(mnbc):
+
+    config = {
+        'host': 'http://testing',
+        'api_key': '12test',
+        'endpoint': 'dcim',
+        'model': 'sites',
+        'update_method': 'partial_update',
+        'schema': True,
+        'pk': ['name'],
+    }
+
+    mnbc.return_value.spec.side_effect = [
+        {'parameters': [{'in': 'body', 'schema': {'properties': {
+            'name': {'type': 'string'},
+            'status': {'type': 'string'},
+            'latitude': {'type': 'number'},
+            'region': {'type': 'integer'},
+        }}}]},
+        {'responses': {'200': {'schema': {'properties': {
+            'status': {'type': 'object', 'properties': {'value': {'type': 'string'}}},
+            'region': {'type': 'object', 'properties': {'id': {'type': 'integer'}}},
+        }}}}},
+    ]
+
+    existing = {
+        'id': 42,
+        'name': 'site-a',
+        'status': {'value': 'active', 'label': 'Active'},
+        'region': {'id': 3, 'name': 'east'},
+        'latitude': 1.5,
+    }
+
+    nbl = NetboxLoader(id='nbloader', config=config)
+    mnbc.return_value.spec.assert_called_with('dcim', 'sites', 'read')
+    mnbc.return_value.entity = asynctest.CoroutineMock()
+    mnbc.return_value.entity.return_value = NetboxResponseObject.from_response(
+        data=existing,
+        type='object',
+        properties={
+            'status': {'type': 'object'},
+            'region': {'type': 'object'},
+        },
+    )
+    mnbc.return_value.build_model.return_value = asynctest.CoroutineMock()
+
+    assert await nbl.run({'name': 'site-a', 'status': 'active', 'region': 3, 'latitude': '1.5', 'slug': 'x'}) is None
+
+    await nbl.run({'name': 'site-a', 'status': 'planned', 'region': 3, 'latitude': '2', 'url': 'x'})
+
+    mnbc.return_value.build_model.return_value.assert_called_once_with(
+        id=42,
+        data={'status': 'planned', 'latitude': 2.0},
+    )
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_checkpoint(mnbc, tmp_path):
+
+    config = {
+        'host': 'http://testing',
+        'api_key': '12test',
+        'endpoint': 'dcim',
+        'model': 'sites',
+        'pk': ['slug'],
+        'checkpoint': {
+            'path': str(tmp_path),
+            'run_id': 'nightly',
+        },
+    }
+
+    mnbc.return_value.close = asynctest.CoroutineMock()
+    nbl = NetboxLoader(id='nbloader', config=config)
+    mnbc.return_value.entity = asynctest.CoroutineMock(return_value=None)
+    mnbc.return_value.build_model.return_value = asynctest.CoroutineMock()
+    mnbc.return_value.build_model.return_value.return_value.id = 12
+
+    await nbl.run({'slug': 'a'})
+    await nbl.close()
+
+    nbl = NetboxLoader(id='nbloader', config=config)
+
+    assert await nbl.run({'slug': 'a'}) is None
+    await nbl.run({'slug': 'b'})
+
+    assert 2 == mnbc.return_value.build_model.return_value.call_count
+
+    await nbl.run({'slug': 'a'})
+
+    assert 3 == mnbc.return_value.build_model.return_value.call_count
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_checkpoint_same_pk(mnbc, tmp_path):
+
+    config = {
+        'host': 'http://testing',
+        'api_key': '12test',
+        'endpoint': 'dcim',
+        'model': 'sites',
+        'pk': ['slug'],
+        'checkpoint': {
+            'path': str(tmp_path),
+            'run_id': 'nightly',
+        },
+    }
+
+    nbl = NetboxLoader(id='nbloader', config=config)
+    mnbc.return_value.entity = asynctest.CoroutineMock(side_effect=[None, AIONetboxResponseMock(id=12)])
+    mnbc.return_value.build_model.return_value = asynctest.CoroutineMock()
+    mnbc.return_value.build_model.return_value.return_value.id = 12
+
+    await nbl.run({'slug': 'a', 'name': 'first'})
+    await nbl.run({'slug': 'a', 'name': 'second'})
+
+    mnbc.return_value.build_model.return_value.assert_called_with(id=12, data={'slug': 'a', 'name': 'second'})
+    assert 2 == mnbc.return_value.build_model.return_value.call_count
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_preflight(mnbc):
+
+    config = {
+        'host': 'http://testing',
+        'api_key': '12test',
+        'endpoint': 'dcim',
+        'model': 'devices',
+        'pk': ['name'],
+        'update_method': 'partial_update',
+        'fk': {
+            'site': {
+                'endpoint': 'dcim',
+                'model': 'sites',
+                'pk': [{'slug': '{site}'}],
+            },
+        },
+        'preflight': {
+            'prefetch': 500,
+        },
+    }
+
+    nbl = NetboxLoader(id='nbloader', config=config)
+    mnbc.return_value.prepare = asynctest.CoroutineMock()
+    nbl.load = asynctest.CoroutineMock()
+
+    await nbl.run({'name': 'a', 'site': 'x'})
+    await nbl.run({'name': 'b', 'site': 'x'})
+
+    mnbc.return_value.prepare.assert_called_once_with([
+        ('dcim', 'devices', ['create', 'list', 'partial_update', 'read'], ()),
+        ('dcim', 'sites', ['list'], ('slug',)),
+    ], prefetch=500)
+    assert 2 == nbl.load.call_count
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_shared_client(mnbc):
+
+    config = {
+        'host': 'http://testing',
+        'api_key': '12test',
+        'endpoint': 'dcim',
+        'model': 'sites',
+        'pk': ['slug'],
+    }
+
+    client = asynctest.MagicMock()
+    client.close = asynctest.CoroutineMock()
+    nbl = NetboxLoader(id='nbloader', config=config, client=client)
+
+    await nbl.close()
+
+    mnbc.assert_not_called()
+    assert nbl.client is client
+    client.close.assert_not_called()
+
+
+def build_batch_loader(mnbc, **kwargs):
+    config = {
+        'host': 'http://testing',
+        'api_key': '12test',
+        'endpoint': 'dcim',
+        'model': 'sites',
+        'pk': ['slug'],
+        'update_method': 'partial_update',
+        'batch': {'size': 3},
+        **kwargs,
+    }
+
+    nbl = NetboxLoader(id='nbloader', config=config)
+
+    existing = {'a': 1, 'b': 2}
+    mnbc.return_value.entity = asynctest.CoroutineMock(
+        side_effect=lambda params, **kw: AIONetboxResponseMock(id=existing[params['slug']])
+        if params['slug'] in existing else None
+    )
+    mnbc.return_value.objects = asynctest.CoroutineMock(return_value={
+        1: {'id': 1, 'slug': 'a', 'name': 'A', 'status': {'value': 'active'}},
+        2: {'id': 2, 'slug': 'b', 'name': 'B', 'status': {'value': 'active'}},
+    })
+    mnbc.return_value.build_model.return_value = asynctest.CoroutineMock()
+    mnbc.return_value.close = asynctest.CoroutineMock()
+
+    return nbl
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_batch(mnbc):
+    nbl = build_batch_loader(mnbc)
+
+    await nbl.run({'slug': 'a', 'name': 'A', 'status': 'active'})
+    await nbl.run({'slug': 'b', 'name': 'B', 'status': 'active'})
+    await nbl.run({'slug': 'b', 'name': 'B', 'status': 'planned'})
+
+    mnbc.return_value.build_model.return_value.assert_not_called()
+
+    await nbl.run({'slug': 'c', 'name': 'C'})
+
+    mnbc.return_value.objects.assert_called_once_with(endpoint='dcim', model='sites', ids=[1, 2])
+    mnbc.return_value.build_model.assert_any_call('dcim', 'sites', 'bulk_partial_update')
+    mnbc.return_value.build_model.return_value.assert_any_call(data={'slug': 'c', 'name': 'C'})
+    mnbc.return_value.build_model.return_value.assert_called_with(data=[{'id': 2, 'status': 'planned'}])
+    mnbc.return_value.remember.assert_any_call(
+        'dcim', 'sites', {'id': 2, 'slug': 'b', 'name': 'B', 'status': 'planned'}
+    )
+
+    await nbl.close()
+
+    assert 2 == mnbc.return_value.build_model.return_value.call_count
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_batch_without_bulk(mnbc):
+    nbl = build_batch_loader(mnbc)
+    func = mnbc.return_value.build_model.return_value
+
+    def build_model(endpoint, model, method):
+        if method == 'bulk_partial_update':
+            raise InvalidNetboxOperation('nope')
+        return func
+
+    mnbc.return_value.build_model.side_effect = build_model
+
+    await nbl.run({'slug': 'a', 'name': 'Z'})
+    await nbl.close()
+
+    func.assert_called_once_with(id=1, data={'name': 'Z'})
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_batch_without_bulk_failed(mnbc):
+    nbl = build_batch_loader(mnbc, report=True)
+    mnbc.return_value.stats = {}
+
+    def partial_update(id, data):
+        if id == 1:
+            raise AIONetboxException('nope')
+
+    func = asynctest.CoroutineMock(side_effect=partial_update)
+
+    def build_model(endpoint, model, method):
+        if method == 'bulk_partial_update':
+            raise InvalidNetboxOperation('nope')
+        return func
+
+    mnbc.return_value.build_model.side_effect = build_model
+
+    await nbl.run({'slug': 'a', 'name': 'Z'})
+    await nbl.run({'slug': 'b', 'name': 'Y'})
+    await nbl.flush_batch()
+
+    assert 2 == func.call_count
+    mnbc.return_value.remember.assert_called_once_with(
+        'dcim', 'sites', {'id': 2, 'slug': 'b', 'name': 'Y', 'status': {'value': 'active'}}
+    )
+    assert 1 == nbl.report.records['failed']
+    assert 1 == nbl.report.records['updated']
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_batch_listed(mnbc):
+    nbl = build_batch_loader(mnbc)
+    listed = NetboxResponseObject.from_response(data={'id': 1, 'slug': 'a', 'name': 'A'}, type='object')
+    mnbc.return_value.entity.side_effect = [listed, AIONetboxResponseMock(id=2)]
+
+    await nbl.run({'slug': 'a', 'name': 'Z'})
+    await nbl.run({'slug': 'b', 'name': 'Y'})
+    await nbl.close()
+
+    mnbc.return_value.objects.assert_called_once_with(endpoint='dcim', model='sites', ids=[2])
+    mnbc.return_value.build_model.return_value.assert_called_once_with(
+        data=[{'id': 1, 'name': 'Z'}, {'id': 2, 'name': 'Y'}]
+    )
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_run_batch_max_wait(mnbc):
+    nbl = build_batch_loader(mnbc, batch={'size': 3, 'max_wait': 0.02})
+
+    await nbl.run({'slug': 'a', 'name': 'Z'})
+    mnbc.return_value.build_model.return_value.assert_not_called()
+
+    await asyncio.sleep(0.05)
+
+    mnbc.return_value.build_model.return_value.assert_called_once_with(data=[{'id': 1, 'name': 'Z'}])
+    assert not nbl.batch
+
+    await nbl.close()
+
+    assert nbl.batch_timer.task is None
+    assert 1 == mnbc.return_value.build_model.return_value.call_count
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_close_batch_failed(mnbc, caplog):
+    nbl = build_batch_loader(mnbc, checkpoint={'path': '/nonexistent', 'run_id': 'x'})
+    nbl.checkpoint.close = MagicMock()
+    mnbc.return_value.build_model.return_value = asynctest.CoroutineMock(side_effect=AIONetboxException('nope'))
+
+    await nbl.run({'slug': 'a', 'name': 'Z'})
+    await nbl.close()
+
+    assert 'Final batch flush failed' in caplog.text
+    nbl.checkpoint.close.assert_called_once()
+    mnbc.return_value.close.assert_called_once()
+
+
+@patch('prophetess_netbox.loader.NetboxClient')
+def test_NetboxLoader_batch_graphql(mnbc, caplog):
+    nbl = build_batch_loader(mnbc, graphql=True, trace={'threshold': 1})
+
+    assert nbl.graphql is None
+    assert nbl.tracer is None
+    assert 'ignoring graphql, trace' in caplog.text
+
+
+@patch('prophetess_netbox.loader.NetboxClient')
+def test_NetboxLoader_batch_update(mnbc):
+    nbl = build_batch_loader(mnbc, update_method='update')
+
+    assert nbl.batch is None
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.loader.NetboxClient')
+async def test_NetboxLoader_report(mnbc, tmp_path):
+
+    config = {
+        'host': 'http://testing',
+        'api_key': '12test',
+        'endpoint': 'dcim',
+        'model': 'sites',
+        'pk': ['slug'],
+        'report': {'path': str(tmp_path / 'report.json')},
+    }
+
+    nbl = NetboxLoader(id='nbloader', config=config)
+    mnbc.return_value.close = asynctest.CoroutineMock()
+    mnbc.return_value.transport.requests = collections.Counter({'GET': 3, 'POST': 1, 'PUT': 1})
+    mnbc.return_value.stats = {}
+    mnbc.return_value.entity = asynctest.CoroutineMock(side_effect=[None, AIONetboxResponseMock(id=1), None])
+    mnbc.return_value.build_model.return_value = asynctest.CoroutineMock(
+        side_effect=[AIONetboxResponseMock(id=2), AIONetboxResponseMock(id=1), AIONetboxException('nope')]
+    )
+
+    await nbl.run({'slug': 'a'})
+    await nbl.run({'slug': 'b'})
+    with pytest.raises(NetboxOperationFailed):
+        await nbl.run({'slug': 'c'})
+    await nbl.close()
+
+    report = json.loads((tmp_path / 'report.json').read_text())
+
+    assert {'seen': 3, 'created': 1, 'updated': 1, 'unchanged': 0, 'failed': 1, 'resumed': 0} == report['records']
+    assert {'total': 5, 'list': 3, 'create': 1, 'update': 1} == report['requests']
+    assert ['create', 'update'] == sorted(report['time']['write_by_method'])
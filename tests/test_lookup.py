@@ -0,0 +1,316 @@
+import pytest
+import asynctest
+
+from unittest.mock import MagicMock
+
+from prophetess_netbox.index import ModelIndex
+from prophetess_netbox.lookup import LookupPlanner
+from prophetess_netbox.exceptions import NetboxPluginException
+
+
+def build_client(count=10, pages=None):
+    pages = pages or [[{'id': 1, 'slug': 'a'}], [{'id': 2, 'slug': 'b'}]]
+
+    async def generate(**kwargs):
+        for page in pages:
+            yield page
+
+    client = MagicMock()
+    client.count = asynctest.CoroutineMock(return_value=count)
+    client.pages = MagicMock(side_effect=generate)
+    client.marker = asynctest.CoroutineMock(return_value=build_marker())
+
+    return client
+
+
+def test_LookupPlanner_invalid():
+    with pytest.raises(NetboxPluginException):
+        LookupPlanner(MagicMock(), strategy='guess')
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_record():
+    client = build_client()
+    lp = LookupPlanner(client)
+
+    assert await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'}) is None
+
+    client.count.assert_not_called()
+    client.pages.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_prefetch():
+    client = build_client()
+    lp = LookupPlanner(client, strategy='prefetch', page_size=50)
+
+    idx = await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'})
+
+    assert idx.complete
+    assert 1 == idx.get({'slug': 'a'})
+    assert 2 == idx.get({'slug': 'b'})
+    assert idx is await lp.index(endpoint='dcim', model='sites', params={'slug': 'b'})
+
+    client.pages.assert_called_once_with(endpoint='dcim', model='sites', params={'limit': 50})
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_auto_expected():
+    client = build_client(count=50000)
+    lp = LookupPlanner(client, strategy='auto', expected=10)
+
+    assert await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'}) is None
+
+    client.count.assert_called_once_with(endpoint='dcim', model='sites')
+
+    lp = LookupPlanner(client, strategy='auto', expected=100)
+
+    assert await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'}) is not None
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_auto_break_even():
+    client = build_client(count=2500)
+    lp = LookupPlanner(client, strategy='auto')
+
+    assert await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'}) is None
+    assert await lp.index(endpoint='dcim', model='sites', params={'slug': 'b'}) is None
+    assert await lp.index(endpoint='dcim', model='sites', params={'slug': 'c'}) is not None
+
+    client.count.assert_called_once()
+    client.pages.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_remember():
+    client = build_client()
+    lp = LookupPlanner(client, strategy='prefetch')
+
+    idx = await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'})
+    lp.remember('dcim', 'sites', {'id': 3, 'slug': 'c'}, created=True)
+    lp.remember('dcim', 'regions', {'id': 4, 'slug': 'd'})
+    lp.remember('dcim', 'sites', True)
+
+    assert 3 == len(idx)
+    assert idx.get({'slug': 'd'}) is None
+
+
+def build_marker(count=2, max_id=2, last_updated='2020-01-01T00:00:00Z'):
+    return {'count': count, 'max_id': max_id, 'last_updated': last_updated}
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_cache():
+    client = build_client()
+    lp = LookupPlanner(client, cache=True, ttl=None)
+
+    idx = await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'})
+
+    assert not idx.complete
+    assert idx.marker is None
+
+    lp.resolved('dcim', 'sites', {'slug': 'a'}, MagicMock(id=1))
+    lp.remember('dcim', 'sites', {'id': 5, 'slug': 'e'}, created=True)
+
+    assert 1 == idx.get({'slug': 'a'})
+    assert 5 == idx.get({'slug': 'e'})
+    client.pages.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_store(tmp_path):
+    client = build_client()
+    client.host = 'http://netbox'
+    client.marker = asynctest.CoroutineMock(return_value=build_marker())
+    path = str(tmp_path / 'nb.db')
+
+    lp = LookupPlanner(client, strategy='prefetch', store=path)
+    await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'})
+    lp.close()
+
+    lp = LookupPlanner(client, strategy='prefetch', store=path)
+    idx = await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'})
+
+    assert idx.complete
+    assert 2 == idx.get({'slug': 'b'})
+    assert 2 == client.marker.call_count
+    client.pages.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_validate_delta():
+    client = build_client(pages=[[{'id': 2, 'slug': 'c'}, {'id': 3, 'slug': 'd'}]])
+    client.marker = asynctest.CoroutineMock(return_value=build_marker(count=3, max_id=3))
+    lp = LookupPlanner(client, store=None, ttl=60)
+
+    idx = ModelIndex('dcim', 'sites', ('slug',))
+    idx.add({'id': 1, 'slug': 'a'}, created=True)
+    idx.add({'id': 2, 'slug': 'b'}, created=True)
+    idx.complete = True
+    idx.marker = build_marker()
+
+    assert idx is await lp.validate(idx)
+    assert idx.get({'slug': 'b'}) is None
+    assert 2 == idx.get({'slug': 'c'})
+    assert 3 == idx.get({'slug': 'd'})
+
+    client.pages.assert_called_once_with(
+        endpoint='dcim',
+        model='sites',
+        params={'last_updated__gte': '2020-01-01T00:00:00Z', 'limit': 1000},
+    )
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_validate_deleted():
+    client = build_client(pages=[[]])
+    client.marker = asynctest.CoroutineMock(return_value=build_marker(count=1, last_updated='2020-02-01T00:00:00Z'))
+    lp = LookupPlanner(client, ttl=60)
+
+    idx = ModelIndex('dcim', 'sites', ('slug',))
+    idx.marker = build_marker()
+
+    assert await lp.validate(idx) is None
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_validate_unchanged():
+    client = build_client()
+    client.marker = asynctest.CoroutineMock(return_value=build_marker())
+    lp = LookupPlanner(client, ttl=60)
+
+    idx = ModelIndex('dcim', 'sites', ('slug',))
+    idx.marker = build_marker()
+
+    assert idx is await lp.validate(idx)
+    client.pages.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_forget():
+    client = build_client()
+    lp = LookupPlanner(client, strategy='prefetch')
+
+    idx = await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'})
+    lp.forget('dcim', 'sites', 1)
+
+    assert idx.get({'slug': 'a'}) is None
+    assert 2 == idx.get({'slug': 'b'})
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_preload():
+    client = build_client(count=2)
+    lp = LookupPlanner(client)
+
+    idx = await lp.preload('dcim', 'sites', ('slug',), max_count=10)
+
+    assert idx.complete
+    assert idx is await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'})
+    assert idx is await lp.preload('dcim', 'sites', ('slug',), max_count=10)
+    assert await lp.index(endpoint='dcim', model='regions', params={'slug': 'a'}) is None
+
+    client.pages.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_preload_expired():
+    client = build_client(count=2)
+    lp = LookupPlanner(client)
+
+    idx = await lp.preload('dcim', 'regions', ('slug',), max_count=10)
+
+    # A region added after startup is found once the index has been revalidated
+    idx.checked -= lp.ttl + 1
+    client.marker.return_value = build_marker(count=3, max_id=3, last_updated='2020-02-01T00:00:00Z')
+    client.pages.side_effect = None
+    client.pages.return_value.__aiter__.return_value = [[{'id': 3, 'slug': 'c'}]]
+
+    assert 3 == (await lp.index(endpoint='dcim', model='regions', params={'slug': 'c'})).get({'slug': 'c'})
+
+    # A region was deleted, the index is prefetched again instead of trusted
+    idx.checked -= lp.ttl + 1
+    client.marker.return_value = build_marker(count=1, max_id=3, last_updated='2020-03-01T00:00:00Z')
+    client.pages.return_value.__aiter__.return_value = [[{'id': 3, 'slug': 'c'}]]
+
+    fresh = await lp.index(endpoint='dcim', model='regions', params={'slug': 'a'})
+
+    assert fresh is not idx
+    assert fresh.complete
+    assert fresh.get({'slug': 'a'}) is None
+    assert 3 == fresh.get({'slug': 'c'})
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_preload_too_large():
+    client = build_client(count=5000)
+    lp = LookupPlanner(client)
+
+    assert await lp.preload('dcim', 'sites', ('slug',), max_count=10) is None
+
+    client.pages.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_unindexable():
+    client = build_client()
+    lp = LookupPlanner(client, strategy='prefetch')
+
+    assert await lp.index(endpoint='dcim', model='sites', params={'name__ie': 'a'}) is None
+    assert await lp.index(endpoint='dcim', model='sites', params={'slug': 'a', 'q': 'b'}) is None
+    assert await lp.index(endpoint='ipam', model='ip-addresses', params={'address': '10.0.0.1'}) is None
+    assert await lp.index(endpoint='dcim', model='sites', params={'cf_code': 'a'}) is None
+    assert await lp.preload('dcim', 'sites', ('tag',), max_count=10) is None
+
+    client.count.assert_not_called()
+    client.pages.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_fields():
+    client = build_client(pages=[[{'id': 1, 'custom_fields': {'code': 'a'}}]])
+    lp = LookupPlanner(client, strategy='prefetch', fields={'DCIM.sites': ['cf_code']})
+
+    idx = await lp.index(endpoint='dcim', model='sites', params={'cf_code': 'a'})
+
+    assert 1 == idx.get({'cf_code': 'a'})
+    assert await lp.index(endpoint='dcim', model='regions', params={'cf_code': 'a'}) is None
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_ttl():
+    client = build_client()
+    lp = LookupPlanner(client, strategy='prefetch')
+
+    idx = await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'})
+    assert lp.ttl is not None
+
+    # An object created in Netbox after the prefetch is found once the index has expired
+    idx.checked -= lp.ttl + 1
+    client.marker.return_value = build_marker(count=3, max_id=3, last_updated='2020-02-01T00:00:00Z')
+    client.pages.side_effect = None
+    client.pages.return_value.__aiter__.return_value = [[{'id': 3, 'slug': 'c'}]]
+
+    assert idx is await lp.index(endpoint='dcim', model='sites', params={'slug': 'c'})
+    assert 3 == idx.get({'slug': 'c'})
+
+
+@pytest.mark.asyncio
+async def test_LookupPlanner_ttl_dropped():
+    client = build_client()
+    lp = LookupPlanner(client, cache=True)
+
+    idx = await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'})
+    idx.resolve({'slug': 'a'}, 1)
+
+    # Objects were deleted, the cache is started over instead of trusted
+    idx.checked -= lp.ttl + 1
+    client.marker.return_value = build_marker(count=1, last_updated='2020-02-01T00:00:00Z')
+    client.pages.side_effect = None
+    client.pages.return_value.__aiter__.return_value = [[]]
+
+    fresh = await lp.index(endpoint='dcim', model='sites', params={'slug': 'a'})
+
+    assert fresh is not idx
+    assert fresh.get({'slug': 'a'}) is None
+    assert fresh is lp.indexes[('dcim', 'sites', ('slug',))]
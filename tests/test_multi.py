@@ -0,0 +1,167 @@
+
+import json
+import collections
+
+import pytest
+import asynctest
+
+from unittest.mock import MagicMock, patch
+
+from prophetess.exceptions import InvalidConfigurationException
+from prophetess_netbox import NetboxMultiLoader
+from prophetess_netbox.exceptions import NetboxOperationFailed
+
+
+def build_config(**kwargs):
+    config = {
+        'host': 'http://testing',
+        'api_key': '12test',
+        'update_method': 'partial_update',
+        'models': [
+            {
+                'endpoint': 'dcim',
+                'model': 'sites',
+                'pk': ['slug'],
+                'fk': {'region': {'endpoint': 'dcim', 'model': 'regions', 'pk': [{'slug': '{region}'}]}},
+            },
+            {
+                'endpoint': 'dcim',
+                'model': 'regions',
+                'pk': ['slug'],
+            },
+            {
+                'endpoint': 'tenancy',
+                'model': 'tenants',
+                'pk': ['slug'],
+            },
+        ],
+    }
+    config.update(kwargs)
+    return config
+
+
+@patch('prophetess_netbox.multi.NetboxClient')
+def test_NetboxMultiLoader(mnbc):
+    nbl = NetboxMultiLoader(id='multi', config=build_config(lookup={'strategy': 'auto'}))
+
+    mnbc.assert_called_once_with(host='http://testing', api_key='12test', lookup={'cache': True, 'strategy': 'auto'})
+    assert ['regions', 'tenants', 'sites'] == list(nbl.parents)
+    assert ['regions'] == nbl.parents['sites']
+    assert all(loader.client is mnbc.return_value for loader in nbl.loaders.values())
+    assert 'partial_update' == nbl.loaders['sites'].update_method
+    assert 'models' not in nbl.loaders['sites'].config
+
+
+@patch('prophetess_netbox.multi.NetboxClient')
+def test_NetboxMultiLoader_cache_ttl(mnbc):
+    NetboxMultiLoader(id='multi', config=build_config(lookup={'ttl': None}))
+    mnbc.assert_called_with(host='http://testing', api_key='12test', lookup={'ttl': None})
+
+    NetboxMultiLoader(id='multi', config=build_config(lookup={'ttl': None, 'cache': True}))
+    mnbc.assert_called_with(host='http://testing', api_key='12test', lookup={'ttl': None, 'cache': True})
+
+    NetboxMultiLoader(id='multi', config=build_config(lookup={'ttl': 300}))
+    mnbc.assert_called_with(host='http://testing', api_key='12test', lookup={'ttl': 300, 'cache': True})
+
+
+@patch('prophetess_netbox.multi.NetboxClient')
+def test_NetboxMultiLoader_cycle(mnbc):
+    config = build_config()
+    config['models'][1]['fk'] = {'site': {'endpoint': 'dcim', 'model': 'sites', 'pk': ['site']}}
+
+    with pytest.raises(InvalidConfigurationException):
+        NetboxMultiLoader(id='multi', config=config)
+
+
+@patch('prophetess_netbox.multi.NetboxClient')
+def test_NetboxMultiLoader_duplicate(mnbc):
+    config = build_config()
+    config['models'].append({'endpoint': 'dcim', 'model': 'regions', 'pk': ['name']})
+
+    with pytest.raises(InvalidConfigurationException):
+        NetboxMultiLoader(id='multi', config=config)
+
+
+@pytest.mark.parametrize('option', ['batch', 'coalesce', 'preflight', 'webhook', 'checkpoint'])
+@patch('prophetess_netbox.multi.NetboxClient')
+def test_NetboxMultiLoader_unsupported(mnbc, option):
+    with pytest.raises(InvalidConfigurationException):
+        NetboxMultiLoader(id='multi', config=build_config(**{option: {}}))
+
+    config = build_config()
+    config['models'][0][option] = {'size': 10}
+
+    with pytest.raises(InvalidConfigurationException):
+        NetboxMultiLoader(id='multi', config=config)
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.multi.NetboxClient')
+async def test_NetboxMultiLoader_report(mnbc, tmp_path):
+    mnbc.return_value.close = asynctest.CoroutineMock()
+    mnbc.return_value.transport.requests = collections.Counter({'GET': 4, 'POST': 2})
+    mnbc.return_value.stats = {}
+    mnbc.return_value.entity = asynctest.CoroutineMock(return_value=None)
+    mnbc.return_value.build_model.return_value = asynctest.CoroutineMock()
+
+    nbl = NetboxMultiLoader(id='multi', config=build_config(report={'path': str(tmp_path / 'report.json')}))
+
+    assert all(loader.report is nbl.report for loader in nbl.loaders.values())
+
+    await nbl.run({'sites': {'slug': 'site-a', 'region': 'east'}, 'regions': {'slug': 'east'}})
+    await nbl.close()
+
+    report = json.loads((tmp_path / 'report.json').read_text())
+
+    assert {'seen': 2, 'created': 2, 'updated': 0, 'unchanged': 0, 'failed': 0, 'resumed': 0} == report['records']
+    assert 3 == report['requests_per_record']
+    assert 'dcim.sites, dcim.regions, tenancy.tenants' == report['model']
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.multi.NetboxClient')
+async def test_NetboxMultiLoader_run(mnbc):
+    nbl = NetboxMultiLoader(id='multi', config=build_config())
+    order = []
+
+    def loaded(key):
+        async def process(record, params):
+            order.append((key, params))
+            return MagicMock(id=len(order))
+        return process
+
+    for key, loader in nbl.loaders.items():
+        loader.process = loaded(key)
+
+    result = await nbl.run({
+        'sites': {'slug': 'site-a', 'region': 'east'},
+        'regions': [{'slug': 'east'}, {'slug': 'west'}],
+    })
+
+    assert [('regions', {'slug': 'east'}), ('regions', {'slug': 'west'}), ('sites', {'slug': 'site-a'})] == order
+    assert result['tenants'] is None
+    assert 3 == result['sites'].id
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.multi.NetboxClient')
+async def test_NetboxMultiLoader_run_failed_parent(mnbc):
+    nbl = NetboxMultiLoader(id='multi', config=build_config())
+    nbl.loaders['regions'].process = asynctest.CoroutineMock(side_effect=NetboxOperationFailed('nope'))
+    nbl.loaders['sites'].process = asynctest.CoroutineMock()
+
+    with pytest.raises(NetboxOperationFailed):
+        await nbl.run({'sites': {'slug': 'site-a', 'region': 'east'}, 'regions': {'slug': 'east'}})
+
+    nbl.loaders['sites'].process.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.multi.NetboxClient')
+async def test_NetboxMultiLoader_close(mnbc):
+    mnbc.return_value.close = asynctest.CoroutineMock()
+    nbl = NetboxMultiLoader(id='multi', config=build_config())
+
+    await nbl.close()
+
+    mnbc.return_value.close.assert_called_once()
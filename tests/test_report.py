@@ -0,0 +1,72 @@
+import json
+import logging
+import collections
+
+from unittest.mock import MagicMock
+
+from prophetess_netbox.report import RunReport
+
+
+def build_stats():
+    stats = collections.defaultdict(collections.Counter)
+    stats[('dcim', 'sites')].update({'lookups': 4, 'hits': 3, 'time': 0.5})
+    stats[('dcim', 'regions')].update({'lookups': 4, 'hits': 0, 'time': 2.0})
+    stats[('tenancy', 'tenants')].update({'lookups': 2, 'hits': 2, 'time': 0.1})
+    return stats
+
+
+def test_RunReport_summary():
+    report = RunReport(slowest=2)
+    for outcome in ('seen', 'seen', 'seen', 'seen', 'created', 'updated', 'unchanged', 'failed'):
+        report.count(outcome)
+    report.written('create', 0.25)
+    report.written('partial_update', 0.5)
+
+    transport = MagicMock(requests=collections.Counter({'GET': 6, 'POST': 1, 'PATCH': 1}))
+    summary = report.summary(transport=transport, stats=build_stats(), model='dcim.sites')
+
+    assert 'dcim.sites' == summary['model']
+    assert {'seen': 4, 'created': 1, 'updated': 1, 'unchanged': 1, 'failed': 1, 'resumed': 0} == summary['records']
+    assert {'total': 8, 'list': 6, 'create': 1, 'update': 1} == summary['requests']
+    assert 2 == summary['requests_per_record']
+    assert 0.5 == summary['cache_hit_ratio']
+    assert {
+        'lookup': 2.6,
+        'write': 0.75,
+        'write_by_method': {'create': 0.25, 'partial_update': 0.5},
+    } == summary['time']
+    assert ['dcim.regions', 'dcim.sites'] == [s['model'] for s in summary['slowest']]
+    assert {'model': 'dcim.regions', 'lookups': 4, 'hit_ratio': 0.0, 'time': 2.0, 'mean': 0.5} == summary['slowest'][0]
+
+
+def test_RunReport_summary_graphql():
+    stats = build_stats()
+    stats[('graphql', 'query')].update({'lookups': 2, 'time': 0.2})
+
+    transport = MagicMock(requests=collections.Counter({'GET': 2, 'POST': 3}))
+    summary = RunReport().summary(transport=transport, stats=stats, model='dcim.sites')
+
+    assert {'total': 5, 'list': 2, 'create': 1, 'graphql': 2} == summary['requests']
+
+    transport = MagicMock(requests=collections.Counter({'POST': 2}))
+    summary = RunReport().summary(transport=transport, stats=stats, model='dcim.sites')
+
+    assert {'total': 2, 'graphql': 2} == summary['requests']
+
+
+def test_RunReport_summary_empty():
+    summary = RunReport().summary(transport=MagicMock(requests=collections.Counter()), stats={}, model='dcim.sites')
+
+    assert summary['requests_per_record'] is None
+    assert summary['cache_hit_ratio'] is None
+    assert [] == summary['slowest']
+
+
+def test_RunReport_emit(tmp_path, caplog):
+    path = tmp_path / 'report.json'
+
+    with caplog.at_level(logging.INFO, logger='prophetess.plugins.netbox.report'):
+        RunReport(path=str(path)).emit({'model': 'dcim.sites'})
+
+    assert {'model': 'dcim.sites'} == json.loads(path.read_text())
+    assert 'Run summary' in caplog.text
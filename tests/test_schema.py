@@ -0,0 +1,113 @@
+import pytest
+
+from prophetess.exceptions import InvalidConfigurationException
+from prophetess_netbox.schema import FieldPlan, boolean
+
+CREATE = {
+    'parameters': [
+        {
+            'in': 'body',
+            'name': 'data',
+            'schema': {
+                'properties': {
+                    'id': {'type': 'integer', 'readOnly': True},
+                    'name': {'type': 'string'},
+                    'status': {'type': 'string', 'enum': ['active', 'planned']},
+                    'region': {'type': 'integer'},
+                    'latitude': {'type': 'number'},
+                    'custom_fields': {'type': 'object'},
+                    'tags': {'type': 'array', 'items': {'type': 'integer'}},
+                },
+            },
+        },
+    ],
+}
+
+READ = {
+    'responses': {
+        '200': {
+            'schema': {
+                'properties': {
+                    'id': {'type': 'integer'},
+                    'name': {'type': 'string'},
+                    'status': {'type': 'object', 'properties': {'value': {'type': 'string'}}},
+                    'region': {'type': 'object', 'properties': {'id': {'type': 'integer'}}},
+                    'custom_fields': {'type': 'object'},
+                    'tags': {
+                        'type': 'array',
+                        'items': {'type': 'object', 'properties': {'id': {'type': 'integer'}}},
+                    },
+                },
+            },
+        },
+    },
+}
+
+
+def test_FieldPlan_from_operations():
+    plan = FieldPlan.from_operations(CREATE, READ)
+
+    assert {'name', 'status', 'region', 'latitude', 'custom_fields', 'tags'} == plan.writable
+    assert {'status': 'value', 'region': 'id', 'tags': 'id'} == plan.compare
+    assert {'name': str, 'status': str, 'region': int, 'latitude': float} == plan.casts
+
+
+def test_FieldPlan_from_operations_request_body():
+    create = {'requestBody': {'content': {'application/json': {'schema': CREATE['parameters'][0]['schema']}}}}
+    read = {'responses': {'200': {'content': {'application/json': READ['responses']['200']}}}}
+
+    plan = FieldPlan.from_operations(create, read)
+
+    assert 'name' in plan.writable
+    assert 'id' == plan.compare['region']
+
+
+def test_FieldPlan_from_operations_empty():
+    with pytest.raises(InvalidConfigurationException):
+        FieldPlan.from_operations({}, {})
+
+    with pytest.raises(InvalidConfigurationException):
+        FieldPlan.from_operations({'parameters': [{'in': 'query', 'name': 'limit'}]}, READ)
+
+
+def test_FieldPlan_shape():
+    plan = FieldPlan.from_operations(CREATE, READ)
+
+    assert {'name': 'a'} == plan.shape({'id': 1, 'name': 'a', 'unknown': True})
+
+
+def test_FieldPlan_cast():
+    plan = FieldPlan.from_operations(CREATE, READ)
+
+    assert 1.5 == plan.cast('latitude', '1.5')
+    assert 4 == plan.cast('region', '4')
+    assert plan.cast('region', None) is None
+    assert 'n/a' == plan.cast('latitude', 'n/a')
+    assert {'id': 4} == plan.cast('region', {'id': 4})
+    assert 'x' == plan.cast('unknown', 'x')
+
+
+def test_FieldPlan_cast_boolean():
+    plan = FieldPlan({'enabled'}, {}, {'enabled': boolean})
+
+    assert plan.cast('enabled', 'false') is False
+    assert plan.cast('enabled', 'FALSE') is False
+    assert plan.cast('enabled', '0') is False
+    assert plan.cast('enabled', 0) is False
+    assert plan.cast('enabled', 'No') is False
+    assert plan.cast('enabled', 'true') is True
+    assert plan.cast('enabled', 'yes') is True
+    assert plan.cast('enabled', 1) is True
+    assert plan.cast('enabled', True) is True
+    assert 'maybe' == plan.cast('enabled', 'maybe')
+
+
+def test_FieldPlan_normalize():
+    plan = FieldPlan.from_operations(CREATE, READ)
+
+    assert 4 == plan.normalize('region', {'id': 4, 'name': 'east'})
+    assert 'active' == plan.normalize('status', {'value': 'active', 'label': 'Active'})
+    assert {'a': 1} == plan.normalize('custom_fields', {'a': 1})
+    assert [1, 2] == plan.normalize('tags', [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}])
+    assert [] == plan.normalize('tags', [])
+    assert plan.normalize('region', None) is None
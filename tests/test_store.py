@@ -0,0 +1,50 @@
+from prophetess_netbox.index import ModelIndex
+from prophetess_netbox.store import IndexStore
+
+
+def build_index(complete=True):
+    idx = ModelIndex('dcim', 'sites', ('slug',))
+    idx.add({'id': 1, 'slug': 'a'}, created=True)
+    idx.add({'id': 2, 'slug': 'b'}, created=True)
+    idx.complete = complete
+    idx.marker = {'count': 2, 'max_id': 2, 'last_updated': '2020-01-01T00:00:00Z'}
+
+    return idx
+
+
+def test_IndexStore(tmp_path):
+    store = IndexStore(str(tmp_path / 'nb.db'), 'http://netbox')
+    store.save(build_index())
+    store.close()
+
+    store = IndexStore(str(tmp_path / 'nb.db'), 'http://netbox')
+    idx = store.load('dcim', 'sites', ('slug',))
+
+    assert idx.complete
+    assert {'count': 2, 'max_id': 2, 'last_updated': '2020-01-01T00:00:00Z'} == idx.marker
+    assert 1 == idx.get({'slug': 'a'})
+    assert 2 == idx.get({'slug': 'b'})
+    assert idx.checked is None
+
+
+def test_IndexStore_missing(tmp_path):
+    store = IndexStore(str(tmp_path / 'nb.db'), 'http://netbox')
+    store.save(build_index())
+
+    assert store.load('dcim', 'regions', ('slug',)) is None
+    assert store.load('dcim', 'sites', ('name',)) is None
+    assert IndexStore(str(tmp_path / 'nb.db'), 'http://other').load('dcim', 'sites', ('slug',)) is None
+
+
+def test_IndexStore_overwrite(tmp_path):
+    store = IndexStore(str(tmp_path / 'nb.db'), 'http://netbox')
+    store.save(build_index())
+
+    idx = build_index(complete=False)
+    idx.remove(2)
+    store.save(idx)
+
+    idx = store.load('dcim', 'sites', ('slug',))
+
+    assert not idx.complete
+    assert 1 == len(idx)
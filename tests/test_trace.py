@@ -0,0 +1,87 @@
+import json
+import collections
+
+from unittest.mock import MagicMock
+
+from prophetess_netbox.trace import Tracer, null_trace, load_callback
+
+
+def build_tracer(**kwargs):
+    transport = MagicMock()
+    transport.requests = collections.Counter()
+
+    return Tracer(transport=transport, **kwargs)
+
+
+def test_load_callback():
+    assert json.dumps == load_callback('json:dumps')
+    assert print == load_callback(print)
+
+
+def test_null_trace():
+    with null_trace.span('pk'):
+        pass
+
+    null_trace.finish()
+
+
+def test_Tracer_trace():
+    cb = MagicMock()
+    tracer = build_tracer(threshold=0, callbacks=[cb])
+
+    trace = tracer.begin({'slug': 'test'})
+    with trace.span('pk'):
+        tracer.transport.requests['GET'] += 2
+
+    with trace.span('write'):
+        tracer.transport.requests['POST'] += 1
+
+    trace.finish()
+
+    assert ['pk', 'write'] == [s.name for s in trace.spans]
+    assert [2, 1] == [s.requests for s in trace.spans]
+    assert 3 == trace.requests
+    assert 2 == cb.call_count
+    assert [trace] == list(tracer.slow)
+
+
+def test_Tracer_fast():
+    tracer = build_tracer(threshold=60)
+
+    tracer.begin({}).finish()
+
+    assert 0 == len(tracer.slow)
+
+
+def test_Tracer_ring_buffer():
+    tracer = build_tracer(threshold=0, sample_size=2)
+
+    for i in range(3):
+        tracer.begin({'id': i}).finish()
+
+    assert [{'id': 1}, {'id': 2}] == [t.key for t in tracer.slow]
+
+
+def test_Tracer_log(tmp_path):
+    path = tmp_path / 'slow.jsonl'
+    tracer = build_tracer(threshold=0, path=str(path))
+
+    trace = tracer.begin({'slug': 'test'})
+    with trace.span('pk'):
+        pass
+    trace.finish()
+
+    data = json.loads(path.read_text())
+
+    assert {'slug': 'test'} == data['key']
+    assert 'pk' == data['spans'][0]['name']
+
+
+def test_Tracer_callback_failure():
+    tracer = build_tracer(callbacks=[MagicMock(side_effect=ValueError)])
+
+    trace = tracer.begin({})
+    with trace.span('pk'):
+        pass
+
+    assert 1 == len(trace.spans)
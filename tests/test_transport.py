@@ -0,0 +1,59 @@
+import pytest
+import aiohttp
+import asynctest
+
+from unittest.mock import patch
+
+from prophetess_netbox.transport import Transport
+
+
+def test_Transport():
+    t = Transport(limit=10, keepalive_timeout=60, compress=True)
+
+    assert 10 == t.connector_options['limit']
+    assert 60 == t.connector_options['keepalive_timeout']
+    assert {'Accept-Encoding': 'gzip, deflate'} == t.headers
+    assert t.timeout is None
+    assert t.session is None
+
+
+def test_Transport_no_compress():
+    t = Transport(compress=False)
+
+    assert {'Accept-Encoding': 'identity'} == t.headers
+
+
+def test_Transport_build_timeout():
+    assert aiohttp.ClientTimeout(total=30) == Transport.build_timeout(30)
+    assert aiohttp.ClientTimeout(connect=5, sock_read=10) == Transport.build_timeout({'connect': 5, 'sock_read': 10})
+
+
+@pytest.mark.asyncio
+@patch('prophetess_netbox.transport.aiohttp.TCPConnector')
+@patch('prophetess_netbox.transport.aiohttp.ClientSession')
+async def test_Transport_request(mcs, mtc):
+    mcs.return_value.request = asynctest.CoroutineMock(return_value='response')
+    t = Transport(timeout=30, ttl_dns_cache=300)
+
+    assert 'response' == await t.request(method='GET', url='http://test', timeout=300)
+
+    mtc.assert_called_once_with(limit=100, limit_per_host=0, keepalive_timeout=15, use_dns_cache=True,
+                                ttl_dns_cache=300)
+    mcs.assert_called_once_with(connector=mtc.return_value, headers={}, timeout=aiohttp.ClientTimeout(total=30))
+    mcs.return_value.request.assert_called_with(
+        method='GET',
+        url='http://test',
+        timeout=aiohttp.ClientTimeout(total=30),
+    )
+
+
+@pytest.mark.asyncio
+async def test_Transport_close():
+    t = Transport()
+    await t.close()
+
+    t.session = asynctest.MagicMock()
+    t.session.close = asynctest.CoroutineMock()
+    await t.close()
+
+    t.session.close.assert_called_once()
@@ -0,0 +1,114 @@
+import hmac
+import json
+import hashlib
+
+import aiohttp
+import pytest
+
+from unittest.mock import MagicMock
+
+from prophetess.exceptions import InvalidConfigurationException
+from prophetess_netbox.webhook import WebhookReceiver
+
+
+def build_payload(event='updated', url='http://netbox/api/dcim/sites/4/'):
+    return {
+        'event': event,
+        'model': 'site',
+        'data': {'id': 4, 'url': url, 'slug': 'site-a'},
+    }
+
+
+def test_WebhookReceiver_apply_updated():
+    lookup = MagicMock()
+    wr = WebhookReceiver(lookup, secret='s3cret')
+
+    wr.apply(build_payload())
+
+    lookup.remember.assert_called_once_with('dcim', 'sites', build_payload()['data'], created=False)
+
+
+def test_WebhookReceiver_apply_created():
+    lookup = MagicMock()
+    wr = WebhookReceiver(lookup, secret='s3cret')
+
+    wr.apply(build_payload(event='created', url='http://netbox/netbox/api/ipam/ip-addresses/4/'))
+
+    lookup.remember.assert_called_once()
+    assert ('ipam', 'ip-addresses') == lookup.remember.call_args[0][:2]
+    assert lookup.remember.call_args[1] == {'created': True}
+
+
+def test_WebhookReceiver_apply_deleted():
+    lookup = MagicMock()
+    wr = WebhookReceiver(lookup, secret='s3cret')
+
+    wr.apply(build_payload(event='deleted'))
+
+    lookup.forget.assert_called_once_with('dcim', 'sites', 4)
+
+
+def test_WebhookReceiver_verify():
+    wr = WebhookReceiver(MagicMock(), secret='s3cret')
+    body = b'{"event": "deleted"}'
+    signature = hmac.new(b's3cret', body, hashlib.sha512).hexdigest()
+
+    assert wr.verify(body, signature)
+    assert not wr.verify(body, 'nope')
+    assert not wr.verify(body, None)
+    assert WebhookReceiver(MagicMock(), insecure=True).verify(body, None)
+
+
+@pytest.mark.asyncio
+async def test_WebhookReceiver_handle():
+    lookup = MagicMock()
+    wr = WebhookReceiver(lookup, host='127.0.0.1', port=0, secret='s3cret')
+    await wr.start()
+    await wr.start()
+
+    port = wr.runner.addresses[0][1]
+    body = json.dumps(build_payload(event='deleted')).encode()
+    signature = hmac.new(b's3cret', body, hashlib.sha512).hexdigest()
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            url = 'http://127.0.0.1:{}/webhook'.format(port)
+
+            async with session.post(url, data=body, headers={'X-Hook-Signature': 'bad'}) as resp:
+                assert 403 == resp.status
+
+            async with session.post(url, data=b'{}', headers={'X-Hook-Signature': hmac.new(
+                    b's3cret', b'{}', hashlib.sha512).hexdigest()}) as resp:
+                assert 400 == resp.status
+
+            async with session.post(url, data=body, headers={'X-Hook-Signature': signature}) as resp:
+                assert 204 == resp.status
+    finally:
+        await wr.stop()
+
+    lookup.forget.assert_called_once_with('dcim', 'sites', 4)
+    assert wr.runner is None
+
+
+def test_WebhookReceiver_secret_required():
+    with pytest.raises(InvalidConfigurationException):
+        WebhookReceiver(MagicMock())
+
+    assert '127.0.0.1' == WebhookReceiver(MagicMock(), secret='s3cret').host
+
+
+@pytest.mark.asyncio
+async def test_WebhookReceiver_start_in_use():
+    first = WebhookReceiver(MagicMock(), port=0, secret='s3cret')
+    await first.start()
+    port = first.runner.addresses[0][1]
+
+    second = WebhookReceiver(MagicMock(), port=port, secret='s3cret')
+    try:
+        await second.start()
+        await second.start()
+    finally:
+        await first.stop()
+
+    assert second.disabled
+    assert second.runner is None